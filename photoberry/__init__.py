@@ -1,4 +1,6 @@
 
-from .app import PhotoBerryApplication, TwitterCredentials
+from .app import PhotoBerryApplication, TwitterCredentials, BUTTON_YES, BUTTON_NO
 from .camera import CameraController
+from . import input
+from . import instrumentation
 
@@ -1,20 +1,49 @@
 
 from logging import warning, debug, error, info
-import os
-from PIL import Image, ImageColor, ImageDraw, ImageFilter
+from PIL import ImageColor, ImageDraw
 import random
-import subprocess
 import threading
-from tempfile import mkstemp
+from time import time
 from TwitterAPI import TwitterAPI
 
-from .camera import CameraController
-from .gpio import GPIOButton
+from . import instrumentation
+from .camera import CameraController, CAPTURE_JPEG
+from .events import InputQueue, EVENT_PRESS
+from .input import ScriptRecorder
+from .printing import PrintQueue, JOB_PENDING
+from .strip import StripCompositor, StripLayout, create_color_transform, read_strip, write_strip, QUALITY_EXACT
 from .timer import Timer
 from . import ui
 
 NAME_GET_STARTED    = "get_started"
 
+TEXT_GET_STARTED    = "Tap the button\nto get started"
+TEXT_EXIT_PROMPT    = "Exit?"
+TEXT_PREPARE        = "Ok, get ready!"
+TEXT_PRINT          = "Print?"
+TEXT_PRINTING       = "Printing..."
+TEXT_COMPLETED      = "Thank You!"
+TEXT_PRINT_FAILED   = "Sorry, your strip\ncouldn't be made"
+
+STRIP_PRINT = "print"
+STRIP_WEB   = "web"
+
+BUTTON_YES  = "yes"
+BUTTON_NO   = "no"
+
+# how far ahead of the countdown's deadline the shutter is armed, this needs
+# to be longer than a tick of the UI loop
+SHUTTER_TRIGGER_WINDOW  = 0.1
+
+# how often the strip being prepared for printing is checked on
+PRINT_POLL_INTERVAL     = 0.1
+
+# the number of print jobs at which guests are warned that the printer is busy
+PRINT_QUEUE_WARNING_DEPTH   = 2
+
+# how long to wait for queued print jobs when exiting
+PRINT_QUEUE_CLOSE_TIMEOUT   = 60
+
 STATE_DEFAULT           = 0
 STATE_EXIT_PROMPT       = 1
 STATE_PREPARE           = 2
@@ -23,6 +52,21 @@ STATE_PICTURE_TAKEN     = 4
 STATE_PRINT             = 5
 STATE_PRINTING          = 6
 STATE_COMPLETED         = 7
+STATE_PRINT_FAILED      = 8
+
+
+def min_deadline(a, b):
+    """
+    Returns the earlier of two deadlines, either of which may be None
+    :param a: a deadline or None
+    :param b: a deadline or None
+    :return: the earlier deadline, or None if both are None
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a, b)
 
 
 class TwitterCredentials(object):
@@ -40,33 +84,71 @@ class PhotoBerryApplication(object):
 
     def __init__(self, photo_resolution, strip_resolution_ratio, yes_pin, no_pin, print_command,
                  twitter_credentials=None, twitter_disable_banner=False,
-                 disable_quit=False):
+                 disable_quit=False, strip_quality=QUALITY_EXACT, in_memory=False, work_dir=None,
+                 capture_format=CAPTURE_JPEG, use_video_port=False, camera_backend=None,
+                 input_backend=None, input_record=None, print_workers=1, print_retries=1,
+                 print_profile=None, printer_icc_profile=None):
         self.photo_resolution = photo_resolution
         self.yes_pin = yes_pin
         self.no_pin = no_pin
         self.strip_resolution_ratio = strip_resolution_ratio
+        self.strip_quality = strip_quality
         self.print_command = print_command
+        self.print_workers = print_workers
+        self.print_retries = print_retries
+        self.print_profile = print_profile
+        self.printer_icc_profile = printer_icc_profile
         self.disable_quit = disable_quit
+        self.in_memory = in_memory
+        self.work_dir = work_dir
+        self.capture_format = capture_format
+        self.use_video_port = use_video_port
+        self.camera_backend = camera_backend
+        self.input_backend = input_backend
+        self.input_record = input_record
 
         self.camera_controller = None
+        self._camera_error = None
         self.window = None
         self.window_renderer = None
         self.preview_renderer = None
+        self.preview_window = None
+        self.interface_window = None
         self.buffer_image = None
+        self.buffer_data = None
         self.canvas = None
+        self.ui_context = None
         self.screen_resolution = None
         self.normalized_screen_resolution = None
+        self.input_queue = InputQueue()
+        self.input_recorder = None
         self.yes_button = None
         self.no_button = None
         self.fps = 1
         self.picture_count = 4
+        self.prepare_duration = 3
+        self.countdown_duration = 5
+        self.picture_taken_duration = 3
+        self.completed_duration = 10
+        self.print_failed_duration = 5
 
         self.state = STATE_DEFAULT
-        self.render_timer = Timer(0.1)
         self.countdown_timer = Timer()
         self.pictures_taken = list()
+        self._compositor = None
+        self.print_queue = None
+        self._print_job = None
+
+        # converting colors for the printer is cheap, building the
+        # conversion isn't, so it's built once for every strip
+        self._print_transform = None
+        if printer_icc_profile:
+            start = time()
+            self._print_transform = create_color_transform(printer_icc_profile)
+            info("built the color transform for %s in %.3fs", printer_icc_profile, time() - start)
 
         self._twitter = None
+        self.twitter_resolution_ratio = 0.5
         self.twitter_disable_banner = twitter_disable_banner
         if twitter_credentials:
             self._twitter_text = twitter_credentials.text
@@ -83,74 +165,194 @@ class PhotoBerryApplication(object):
         Starts the application.  This method blocks until the application is stopped.
         """
 
+        start = time()
+
+        # the camera is slow to initialize, so set up everything that
+        # doesn't need it while it is being created
         info("creating camera")
-        self.camera_controller = CameraController()
-        self.camera_controller.camera.resolution = self.photo_resolution
+        camera_thread = threading.Thread(target=self._create_camera_in_background, name='photoberry-camera')
+        camera_thread.start()
 
         self.screen_resolution = ui.get_screen_resolution()
         self.normalized_screen_resolution = ui.normalize_dimension(self.screen_resolution)
         info("screen_resolution: %s", self.screen_resolution)
         info("normalized_screen_resolution: %s", self.normalized_screen_resolution)
 
+        self.preview_window = ui.normalize_dimension((
+            0, 0,
+            self.normalized_screen_resolution[0] * 0.75,
+            self.normalized_screen_resolution[1]
+        ))
+
+        # the overlay only covers the interface to the right of the preview
+        self.interface_window = ui.normalize_dimension((
+            self.preview_window[2],
+            0,
+            self.normalized_screen_resolution[0] - self.preview_window[2],
+            self.normalized_screen_resolution[1]
+        ))
+
         info("creating buffer image and canvas")
-        self.buffer_image = Image.new('RGB', self.normalized_screen_resolution)
+        (self.buffer_image, self.buffer_data) = ui.create_buffer_image(self.interface_window[2:])
         self.canvas = ImageDraw.Draw(self.buffer_image)
         debug("buffer_image resolution: %s", self.buffer_image.size)
 
+        info("setting up UI")
+        self._setup_ui()
+        self._prerender_ui()
+        self.ui_context = ui.UIContext(self.canvas, self.window,
+                                       update_function=self._logic,
+                                       render_function=self._render,
+                                       deadline_function=self._next_deadline)
+
+        info("setting up input")
+        self.input_queue.callback = self.ui_context.wake
+        self._create_buttons()
+
+        camera_thread.join()
+        if self._camera_error:
+            raise self._camera_error
+        debug("camera ready after %.3fs", time() - start)
+
         info("creating preview renderer")
         self.preview_renderer = self.camera_controller.start_preview(
             fullscreen=False,
-            window=ui.normalize_dimension((
-                0, 0,
-                self.normalized_screen_resolution[0] * 0.75,
-                self.normalized_screen_resolution[1]
-            )))
+            window=self.preview_window)
         debug("preview location: %s", self.preview_renderer.window)
 
         info("creating window renderer")
         self.window_renderer = self.camera_controller.add_overlay(
-            self.buffer_image.tobytes(),
+            self.buffer_data,
             size=self.buffer_image.size,
+            format='rgba',
             fullscreen=False,
             layer=1,
-            window=(
-                0, 0,
-                self.normalized_screen_resolution[0],
-                self.normalized_screen_resolution[1]
-            ))
+            window=self.interface_window)
         debug("window location: %s", self.window_renderer.window)
+        info("started in %.3fs", time() - start)
 
-        info("setting up UI")
-        self._setup_ui()
-
-        info("setting up input")
-        self.yes_button = GPIOButton(self.yes_pin)
-        self.no_button = GPIOButton(self.no_pin)
+        self.print_queue = PrintQueue(self.print_command, workers=self.print_workers, retries=self.print_retries)
 
         info("starting app")
+        if self.input_record:
+            self.input_recorder = ScriptRecorder(self.input_record)
+        self.input_backend.start()
         self._enter_state(STATE_DEFAULT)
-        self.render_timer.start()
-        ui_context = ui.UIContext(self.canvas, self.window, update_function=self._logic)
-        ui_context.main_loop()
-
+        try:
+            self.ui_context.main_loop()
+        finally:
+            self.input_backend.close()
+            if self.input_recorder:
+                self.input_recorder.close()
+            self.print_queue.close(timeout=PRINT_QUEUE_CLOSE_TIMEOUT)
+            self.camera_controller.close()
+
+        debug("font cache: %s", ui.fonts.stats)
+        debug("sprite cache: %s hits, %s misses", ui.sprite_cache.hits, ui.sprite_cache.misses)
         info("exiting")
 
-    def _logic(self):
+    def _create_camera_in_background(self):
         """
-        Called by the UI system on every tick so that it can be updated.
+        Creates the camera controller, keeping the exception if it fails so
+        that it can be raised once the rest of the app is set up
         """
-        yes = self.yes_button.was_pressed or self.yes_button.pressed
-        no = self.no_button.was_pressed or self.no_button.pressed
+        try:
+            self.camera_controller = self._create_camera()
+        except Exception as e:
+            error("unable to create camera: %s", e)
+            self._camera_error = e
 
-        # render
-        if self.render_timer.finished:
-            # start = time()
-            self.window_renderer.update(self.buffer_image.tobytes())
-            # debug("render time: %s", time() - start)
-            self.render_timer.start()
+    def _create_camera(self):
+        """
+        Creates the camera controller
+        :return: the camera controller
+        """
+        camera_controller = CameraController(
+            in_memory=self.in_memory,
+            work_dir_root=self.work_dir,
+            capture_format=self.capture_format,
+            capture_size=self._strip_layout().photo_size,
+            frame_buffer_count=self.picture_count,
+            use_video_port=self.use_video_port,
+            backend=self.camera_backend)
+        camera_controller.camera.resolution = self.photo_resolution
+        return camera_controller
+
+    def _render(self, damage):
+        """
+        Pushes the buffer image to the overlay.  Called by the UI system after
+        it has drawn on the buffer image, which draws straight into buffer_data.
+        :param damage: the (x,y,width,height) region that changed, picamera's
+            overlays can only be updated whole so it's only logged
+        """
+        debug("rendering, damage: %s", damage)
+        self.window_renderer.update(self.buffer_data)
 
+    def _create_buttons(self):
+        """
+        Creates the yes and no buttons, on GPIO pins unless another input
+        backend was given
+        """
+        if not self.input_backend:
+            from .gpio import GPIOInputBackend
+            self.input_backend = GPIOInputBackend({BUTTON_YES: self.yes_pin, BUTTON_NO: self.no_pin})
+        self.yes_button = self.input_backend.create_button(BUTTON_YES, self.input_queue)
+        self.no_button = self.input_backend.create_button(BUTTON_NO, self.input_queue)
+
+    def _next_deadline(self):
+        """
+        Called by the UI system after every tick to find out when the next
+        tick is needed, input wakes it up on its own.
+        :return: the time of the next tick, or None if only input matters
+        """
+        deadline = self.input_queue.next_deadline()
+
+        if self.state in (STATE_PREPARE, STATE_PICTURE_TAKEN, STATE_COMPLETED, STATE_PRINT_FAILED):
+            deadline = min_deadline(deadline, self.countdown_timer.deadline)
+
+        elif self.state == STATE_PICTURE_COUNTDOWN:
+            # the next change of the seconds shown, or arming the shutter
+            next_second = self.countdown_timer.deadline - int(self.countdown_timer.remaining)
+            trigger = self.countdown_timer.deadline - SHUTTER_TRIGGER_WINDOW
+            deadline = min_deadline(deadline, min(next_second, trigger))
+
+        elif self.state == STATE_PRINTING:
+            deadline = min_deadline(deadline, time() + PRINT_POLL_INTERVAL)
+
+        return deadline
+
+    def _logic(self):
+        """
+        Called by the UI system on every tick so that it can be updated.  The
+        state machine steps once for every input event, in the order that
+        they happened, and once more for timers.
+        """
+        while True:
+            event = self.input_queue.get()
+            if event is None:
+                return self._step(False, False)
+
+            if self.input_recorder:
+                self.input_recorder.record(event)
+            yes = event.kind == EVENT_PRESS and event.button == BUTTON_YES
+            no = event.kind == EVENT_PRESS and event.button == BUTTON_NO
+            running = self._step(yes, no)
+            instrumentation.record(instrumentation.INPUT_LATENCY, event.latency)
+            debug("handled %s after %.3fs", event, event.latency)
+            if not running:
+                return False
+
+    def _step(self, yes, no):
+        """
+        Advances the state machine
+        :param yes: True if the yes button was just pressed
+        :param no: True if the no button was just pressed
+        :return: False to stop the application
+        """
         if self.state == STATE_DEFAULT:
-            if (no and not self.disable_quit) or (no and yes):
+            # both buttons at once bring up the exit prompt even when quitting is disabled
+            both = (yes and self.no_button.pressed) or (no and self.yes_button.pressed)
+            if (no and not self.disable_quit) or both:
                 self._enter_state(STATE_EXIT_PROMPT)
             elif yes:
                 self._enter_state(STATE_PREPARE)
@@ -167,26 +369,30 @@ class PhotoBerryApplication(object):
             elif self.countdown_timer.finished:
                 self.pictures_taken = list()
                 self.camera_controller.clear_workdir()
+                self._compositor = self._create_compositor()
                 self._enter_state(STATE_PICTURE_COUNTDOWN)
 
         elif self.state == STATE_PICTURE_COUNTDOWN:
             if no:
                 self._enter_state(STATE_DEFAULT)
-            elif self.countdown_timer.finished:
-                self.pictures_taken.append(self.camera_controller.capture_photo())
+            elif self.countdown_timer.remaining <= SHUTTER_TRIGGER_WINDOW:
+                photo = self.camera_controller.capture_photo(deadline=self.countdown_timer.deadline)
+                self.pictures_taken.append(photo)
+                self._compositor.add_photo(photo)
                 self._enter_state(STATE_PICTURE_TAKEN)
             else:
-                self.window.find_by_name(NAME_GET_STARTED).text = "" \
-                        + str(len(self.pictures_taken) + 1) + " of " + str(self.picture_count) \
-                        + "\n" + str(int(self.countdown_timer.remaining) + 1)
+                self.window.find_by_name(NAME_GET_STARTED).text = self._countdown_text(
+                    len(self.pictures_taken) + 1, int(self.countdown_timer.remaining) + 1)
 
         elif self.state == STATE_PICTURE_TAKEN:
             if no:
                 self._enter_state(STATE_DEFAULT)
             elif self.countdown_timer.finished:
                 if len(self.pictures_taken) >= self.picture_count:
-                    t = threading.Thread(target=self._upload_to_twitter)
-                    t.start()
+                    if self._twitter:
+                        self._compositor.release(STRIP_WEB)
+                        t = threading.Thread(target=self._upload_to_twitter, args=(self._compositor,))
+                        t.start()
                     self._enter_state(STATE_PRINT)
                 else:
                     self._enter_state(STATE_PICTURE_COUNTDOWN)
@@ -200,13 +406,29 @@ class PhotoBerryApplication(object):
         elif self.state == STATE_PRINTING:
             if no:
                 self._enter_state(STATE_DEFAULT)
-            else:
-                strip_file = self.create_strip()
-                args = self.print_command.replace('{filename}', strip_file).split()
-                subprocess.Popen(args)
+            elif self._compositor.done and self._compositor.error:
+                error("unable to print, the strip failed: %s", self._compositor.error)
+                self._enter_state(STATE_PRINT_FAILED)
+            elif self._compositor.done:
+                start = time()
+                self._compositor.release(STRIP_PRINT)
+                print_file = write_strip(self._compositor.result()[STRIP_PRINT], self.work_dir)
+                self._compositor.cancel()
+                self._compositor = None
+                self._print_job = self.print_queue.submit(print_file)
+                instrumentation.record(instrumentation.PRINT_SUBMIT, time() - start)
                 self._enter_state(STATE_COMPLETED)
+            else:
+                self.window.find_by_name(NAME_GET_STARTED).text = TEXT_PRINTING + "\nPreparing strip " \
+                        + str(int(self._compositor.progress * 100)) + "%"
+
+        elif self.state == STATE_PRINT_FAILED:
+            if yes or no or self.countdown_timer.finished:
+                self._enter_state(STATE_DEFAULT)
 
         elif self.state == STATE_COMPLETED:
+            if no and self._print_job:
+                self.print_queue.cancel(self._print_job.id)
             if yes or no or self.countdown_timer.finished:
                 self._enter_state(STATE_DEFAULT)
 
@@ -215,16 +437,41 @@ class PhotoBerryApplication(object):
 
         return True
 
-    def _upload_to_twitter(self):
+    def _upload_to_twitter(self, compositor):
         """
-        Creates a strip and uploads it to twitter.
+        Waits for the web strip and uploads it to twitter.
+        :param compositor: the compositor producing the strip
         """
-        if self._twitter:
-            strip_file = self.create_strip(resolution_ratio=0.5)
-            f = open(strip_file)
-            self._twitter.request('statuses/update_with_media', {'status': self._twitter_text}, {'media[]': f.read()})
-            f.close()
-            os.remove(strip_file)
+        try:
+            strip = compositor.result().get(STRIP_WEB)
+        except Exception as e:
+            warning("not uploading to twitter, the strip failed: %s", e)
+            return
+        if not strip:
+            warning("not uploading to twitter, the strip was cancelled before it was finished")
+            return
+        with instrumentation.timed(instrumentation.UPLOAD):
+            self._twitter.request('statuses/update_with_media', {'status': self._twitter_text},
+                                  {'media[]': read_strip(strip)})
+
+    def _countdown_text(self, picture, seconds):
+        """
+        Returns the text shown while counting down to a picture
+        :param picture: the number of the picture being taken
+        :param seconds: the number of seconds left
+        :return: the text
+        """
+        return str(picture) + " of " + str(self.picture_count) + "\n" + str(seconds)
+
+    def _completed_text(self):
+        """
+        Returns the text shown once a session is completed
+        :return: the text
+        """
+        text = TEXT_COMPLETED
+        if self._twitter and not self.twitter_disable_banner:
+            text = text + "\nSee your photos at\n@" + self._twitter_username + "\non twitter!"
+        return text
 
     def _enter_state(self, state):
         """
@@ -234,38 +481,60 @@ class PhotoBerryApplication(object):
 
         if state == STATE_DEFAULT:
             self.pictures_taken = list()
-            self.window.find_by_name(NAME_GET_STARTED).text = "Tap the button\nto get started"
+            self._print_job = None
+            if self._compositor:
+                self._compositor.cancel()
+                self._compositor = None
+            self.window.find_by_name(NAME_GET_STARTED).text = TEXT_GET_STARTED
             self.window.find_by_name(NAME_GET_STARTED).font_color = (0, 0, 0, 255)
 
         elif state == STATE_EXIT_PROMPT:
-            self.window.find_by_name(NAME_GET_STARTED).text = "Exit?"
+            self.window.find_by_name(NAME_GET_STARTED).text = TEXT_EXIT_PROMPT
             self.window.find_by_name(NAME_GET_STARTED).font_color = (255, 0, 0, 255)
 
         elif state == STATE_PREPARE:
-            self.window.find_by_name(NAME_GET_STARTED).text = "Ok, get ready!"
+            self.window.find_by_name(NAME_GET_STARTED).text = TEXT_PREPARE
             self.window.find_by_name(NAME_GET_STARTED).font_color = (0, 0, 0, 255)
-            self.countdown_timer.start(3)
+            self.countdown_timer.start(self.prepare_duration)
 
         elif state == STATE_PICTURE_COUNTDOWN:
+            self.countdown_timer.start(self.countdown_duration)
+            # the ticks only come when the seconds change, so the first is shown now
+            self.window.find_by_name(NAME_GET_STARTED).text = self._countdown_text(
+                len(self.pictures_taken) + 1, int(self.countdown_timer.remaining) + 1)
             self.window.find_by_name(NAME_GET_STARTED).font_color = (0, 0, 0, 255)
-            self.countdown_timer.start(5)
 
         elif state == STATE_PICTURE_TAKEN:
             self.window.find_by_name(NAME_GET_STARTED).text = random.sample(ui.picture_taken_sentances, 1)[0]
-            self.countdown_timer.start(3)
+            self.countdown_timer.start(self.picture_taken_duration)
 
         elif state == STATE_PRINT:
-            self.window.find_by_name(NAME_GET_STARTED).text = "Print?"
+            text = TEXT_PRINT
+            depth = self.print_queue.depth
+            if depth >= PRINT_QUEUE_WARNING_DEPTH:
+                text = text + "\nThe printer is busy,\n" + str(depth) + " prints are waiting"
+            self.window.find_by_name(NAME_GET_STARTED).text = text
 
         elif state == STATE_PRINTING:
-            self.window.find_by_name(NAME_GET_STARTED).text = "Printing..."
+            self.window.find_by_name(NAME_GET_STARTED).text = TEXT_PRINTING
 
         elif state == STATE_COMPLETED:
-            text = "Thank You!"
-            if self._twitter and not self.twitter_disable_banner:
-                text = text + "\nSee your photos at\n@" + self._twitter_username + "\non twitter!"
+            text = self._completed_text()
+            ahead = self.print_queue.depth - 1
+            if self._print_job and self._print_job.status == JOB_PENDING and ahead > 0:
+                # the print can only be cancelled while the guest is told it's waiting
+                text = text + "\n" + str(ahead) + " prints are ahead of yours,\npress no to cancel yours"
+            else:
+                self._print_job = None
             self.window.find_by_name(NAME_GET_STARTED).text = text
-            self.countdown_timer.start(10)
+            self.countdown_timer.start(self.completed_duration)
+
+        elif state == STATE_PRINT_FAILED:
+            if self._compositor:
+                self._compositor.cancel()
+                self._compositor = None
+            self.window.find_by_name(NAME_GET_STARTED).text = TEXT_PRINT_FAILED
+            self.countdown_timer.start(self.print_failed_duration)
 
         else:
             raise RuntimeError("Attempted to enter an unknown state: " + str(state))
@@ -274,80 +543,104 @@ class PhotoBerryApplication(object):
 
     def _setup_ui(self):
         """
-        Sets up the UI
+        Sets up the UI, the root widget covers the overlay, which is only the
+        interface to the right of the preview
         """
 
         self.window = ui.Widget()
-        self.window.dimensions = ui.normalize_dimension((
-            0, 0,
-            self.normalized_screen_resolution[0],
-            self.normalized_screen_resolution[1]
-        ))
-        self.window.background_color = ImageColor.getcolor('#000000', 'RGB')
-
-        interface_frame = ui.Widget(parent=self.window)
-        interface_frame.dimensions = ui.normalize_dimension((
-            self.preview_renderer.window[2],
-            0,
-            self.normalized_screen_resolution[0] - self.preview_renderer.window[2],
-            self.normalized_screen_resolution[1]
-        ))
-        interface_frame.background_color = ImageColor.getcolor('#ffffff', 'RGB')
+        self.window.dimensions = (0, 0) + self.buffer_image.size
+        self.window.background_color = ImageColor.getcolor('#ffffff', 'RGB')
 
         number = ui.LabelWidget("",
                                 name=NAME_GET_STARTED,
-                                parent=interface_frame,
+                                parent=self.window,
                                 align="center",
                                 font_color=(0, 0, 0, 255))
         number.dimensions = (
             5, 5,
-            interface_frame.width - 10,
-            interface_frame.height - 10
+            self.window.width - 10,
+            self.window.height - 10
         )
 
+    def _prerender_ui(self):
+        """
+        Rasterizes the texts that the booth displays up front, so that showing
+        them later doesn't involve rendering any text
+        """
+        texts = [TEXT_GET_STARTED, TEXT_EXIT_PROMPT, TEXT_PREPARE, TEXT_PRINT, TEXT_PRINTING,
+                 TEXT_PRINT_FAILED, self._completed_text()]
+        texts.extend(ui.picture_taken_sentances)
+        for picture in range(1, self.picture_count + 1):
+            for seconds in range(1, int(self.countdown_duration) + 1):
+                texts.append(self._countdown_text(picture, seconds))
+        start = time()
+        self.window.find_by_name(NAME_GET_STARTED).prerender(self.canvas, texts)
+        debug("prerendered %s texts in %.3fs", len(texts), time() - start)
+
+    def _strip_outputs(self):
+        """
+        Returns the strips to create for each session: the print strip plus the
+        web strip when uploading to twitter.  With a print profile the print
+        strip is the page's size and the web strip is no larger than it.
+        :return: a dict of output name to resolution ratio
+        """
+        print_layout = self._print_layout()
+        if print_layout:
+            outputs = {STRIP_PRINT: print_layout.resolution_ratio}
+        else:
+            outputs = {STRIP_PRINT: self.strip_resolution_ratio}
+        if self._twitter:
+            outputs[STRIP_WEB] = min(self.twitter_resolution_ratio, outputs[STRIP_PRINT]) \
+                if print_layout else self.twitter_resolution_ratio
+        return outputs
+
+    def _print_layout(self):
+        """
+        Returns the layout of the print strip on the print profile's page
+        :return: the layout, or None if there isn't a print profile
+        """
+        if not self.print_profile:
+            return None
+        return self.print_profile.layout(self.photo_resolution, self.picture_count)
+
+    def _strip_layout(self):
+        """
+        Returns the layout of the largest strip created for each session
+        :return: the layout
+        """
+        return self._print_layout() or \
+            StripLayout(self.photo_resolution, max(self._strip_outputs().values()), self.picture_count)
+
+    def _create_compositor(self, outputs=None, layout=None):
+        """
+        Creates a compositor for a strip of the pictures that are about to be taken
+        :param outputs: a dict of output name to resolution ratio, defaults to _strip_outputs
+        :param layout: the layout of the largest output, defaults to the print
+            profile's when outputs defaults
+        :return: the compositor
+        """
+        if not outputs:
+            outputs = self._strip_outputs()
+            layout = self._print_layout()
+        return StripCompositor(self.photo_resolution, self.picture_count, outputs,
+                               quality=self.strip_quality,
+                               in_memory=self.in_memory,
+                               work_dir=self.work_dir,
+                               layout=layout,
+                               transforms={STRIP_PRINT: self._print_transform} if self._print_transform else None)
+
     def create_strip(self, resolution_ratio=None):
         """
         Combines the images in taken_photos into one
+        :param resolution_ratio: the size of the photos in the strip, defaults
+            to strip_resolution_ratio, or to filling the print profile's page
         :return: the combined image
         """
-
+        layout = None
         if not resolution_ratio:
-            resolution_ratio = self.strip_resolution_ratio
-
-        padding = 40
-        photo_width = int(self.photo_resolution[0] * resolution_ratio)
-        photo_height = int(self.photo_resolution[1] * resolution_ratio)
-        width = (photo_width * 2) + (padding * 4)
-        height = (photo_height * self.picture_count) + (padding * (self.picture_count + 1))
-
-        strip = Image.new('RGB', (width, height))
-        canvas = ImageDraw.Draw(strip)
-        canvas.rectangle((0, 0, width, height), fill=ImageColor.getcolor('#ffffff', 'RGB'))
-
-        for i in range(0, self.picture_count):
-            image = Image.open(self.pictures_taken[i])
-            image = image.convert(mode='RGB')
-            image = image.resize((photo_width, photo_height), resample=Image.LANCZOS)
-            strip.paste(image, box=(
-                padding,
-                padding + (padding * i) + (photo_height * i)
-            ))
-            strip.paste(image, box=(
-                padding + photo_width + padding + padding,
-                padding + (padding * i) + (photo_height * i)
-            ))
-            del image
-
-        strip = strip.transpose(Image.FLIP_LEFT_RIGHT)
-        strip = strip.filter(ImageFilter.DETAIL)
-        strip = strip.filter(ImageFilter.SHARPEN)
-
-        (handle, file_name) = mkstemp(suffix='.jpg', prefix='photoberry-strip')
-        os.close(handle)
-        handle = open(file_name, 'wb')
-        strip.save(handle, format='jpeg', quality=95, optimize=True)
-        handle.close()
-        handle.close()
-        del strip
-        return file_name
-
+            layout = self._print_layout()
+            resolution_ratio = self._strip_outputs()[STRIP_PRINT]
+        compositor = self._create_compositor({STRIP_PRINT: resolution_ratio}, layout)
+        for picture in self.pictures_taken:
+            compositor.add_photo(picture)
+        return write_strip(compositor.result()[STRIP_PRINT], self.work_dir)
@@ -0,0 +1,167 @@
+
+import click
+import logging
+from time import time
+
+from . import instrumentation
+from .app import PhotoBerryApplication, BUTTON_YES, BUTTON_NO, STATE_DEFAULT, STATE_EXIT_PROMPT, STATE_PREPARE, \
+    STATE_PICTURE_TAKEN, STATE_PRINT, STATE_COMPLETED
+from .camera import SyntheticCameraBackend
+from .events import Button
+from .input import InputBackend, ScriptedInputBackend, load_script
+from .strip import PRINT_PROFILES
+
+logging.basicConfig(format='[%(asctime)s] %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
+
+
+class BenchmarkInputBackend(InputBackend):
+    """
+    Taps the buttons whenever the application is in a state that waits for them
+    """
+
+    def __init__(self, app):
+        self._app = app
+        self._buttons = dict()
+
+    def create_button(self, name, queue):
+        button = Button(name, queue, debounce=0)
+        self._buttons[name] = button
+        return button
+
+    def tap_if_needed(self):
+        for name, states in ((BUTTON_YES, self._app._yes_states()), (BUTTON_NO, self._app._no_states())):
+            if self._app.state in states:
+                self._buttons[name]._edge(True)
+                self._buttons[name]._edge(False)
+
+
+class BenchmarkApplication(PhotoBerryApplication):
+    """
+    Drives full sessions through the application, with a synthetic camera,
+    and records how long each part of every session took.  The buttons are
+    tapped as soon as the application waits for them, unless an input
+    backend is given, such as a script to replay.
+    """
+
+    def __init__(self, sessions, *args, **kwargs):
+        super(BenchmarkApplication, self).__init__(*args, **kwargs)
+        self.sessions = sessions
+        self._tapping = self.input_backend is None
+        if self._tapping:
+            self.input_backend = BenchmarkInputBackend(self)
+        self.results = list()
+        self._session = None
+        self._compositor_created = None
+
+    def _logic(self):
+        if self._tapping:
+            self.input_backend.tap_if_needed()
+        return super(BenchmarkApplication, self)._logic()
+
+    def _yes_states(self):
+        if len(self.results) < self.sessions:
+            return STATE_DEFAULT, STATE_PRINT, STATE_COMPLETED
+        return STATE_EXIT_PROMPT,
+
+    def _no_states(self):
+        if len(self.results) < self.sessions:
+            return ()
+        return STATE_DEFAULT,
+
+    def _next_deadline(self):
+        # the buttons press themselves, so tick right away when one will
+        if self._tapping and (self.state in self._yes_states() or self.state in self._no_states()):
+            return time()
+        return super(BenchmarkApplication, self)._next_deadline()
+
+    def _create_compositor(self, outputs=None, layout=None):
+        self._compositor_created = super(BenchmarkApplication, self)._create_compositor(outputs, layout)
+        return self._compositor_created
+
+    def _enter_state(self, state):
+        if state == STATE_PREPARE:
+            self._session = {'start': time(), 'capture': 0.0}
+        elif state == STATE_PICTURE_TAKEN:
+            self._session['capture'] += self.camera_controller.last_capture_time
+        elif state == STATE_COMPLETED:
+            self._session['composite'] = self._compositor_created.timings['composite']
+            self._session['color'] = self._compositor_created.timings['color']
+            self._session['encode'] = self._compositor_created.timings['encode']
+            self._session['total'] = time() - self._session.pop('start')
+            self.results.append(self._session)
+            logging.info("session %s: %s", len(self.results), self._session)
+        super(BenchmarkApplication, self)._enter_state(state)
+
+
+@click.command()
+@click.option('--sessions', nargs=1, type=int, default=5)
+@click.option('--photo-resolution', nargs=2, type=click.Tuple([int, int]), default=(1640, 1232))
+@click.option('--strip-resolution-ratio', nargs=1, type=float, default=0.75)
+@click.option('--strip-quality', type=click.Choice(['fast', 'exact']), default='exact')
+@click.option('--capture-format', type=click.Choice(['jpeg', 'raw']), default='jpeg')
+@click.option('--capture-latency', nargs=1, type=float, default=0.0)
+@click.option('--state-duration', nargs=1, type=float, default=0.1)
+@click.option('--print-command', nargs=1, type=str, default='rm {filename}')
+@click.option('--print-workers', nargs=1, type=click.IntRange(min=1), default=1)
+@click.option('--print-retries', nargs=1, type=click.IntRange(min=0), default=1)
+@click.option('--print-profile', type=click.Choice(sorted(PRINT_PROFILES.keys())))
+@click.option('--printer-icc-profile', nargs=1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--in-memory', is_flag=True)
+@click.option('--work-dir', nargs=1, type=click.Path(exists=True, file_okay=False))
+@click.option('--input-script', nargs=1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--instrument-file', nargs=1, type=click.Path(dir_okay=False, writable=True))
+@click.option('--debug', is_flag=True)
+def main(sessions, photo_resolution, strip_resolution_ratio, strip_quality, capture_format, capture_latency,
+         state_duration, print_command, print_workers, print_retries, print_profile, printer_icc_profile,
+         in_memory, work_dir, input_script, instrument_file, debug):
+    """
+    Runs photo booth sessions against a synthetic camera and reports how long they took
+    """
+
+    logger = logging.getLogger()
+    if debug:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.INFO)
+
+    instrumentation.enable()
+
+    app = BenchmarkApplication(
+        sessions,
+        photo_resolution, strip_resolution_ratio,
+        None, None,
+        print_command,
+        strip_quality=strip_quality,
+        print_workers=print_workers,
+        print_retries=print_retries,
+        print_profile=PRINT_PROFILES[print_profile] if print_profile else None,
+        printer_icc_profile=printer_icc_profile,
+        in_memory=in_memory,
+        work_dir=work_dir,
+        capture_format=capture_format,
+        camera_backend=SyntheticCameraBackend(latency=capture_latency),
+        input_backend=ScriptedInputBackend(load_script(input_script)) if input_script else None)
+    app.prepare_duration = state_duration
+    app.countdown_duration = state_duration
+    app.picture_taken_duration = state_duration
+    app.completed_duration = state_duration
+    app.print_failed_duration = state_duration
+
+    app.run()
+
+    if not app.results:
+        raise click.ClickException("no sessions were completed")
+
+    click.echo("%-10s %10s %10s %10s" % ("", "mean", "min", "max"))
+    for name in ('capture', 'composite', 'color', 'encode', 'total'):
+        values = [result[name] for result in app.results]
+        click.echo("%-10s %9.3fs %9.3fs %9.3fs" % (name, sum(values) / len(values), min(values), max(values)))
+    total = sum(result['total'] for result in app.results)
+    click.echo("sessions per hour: %.1f" % (3600.0 * len(app.results) / total))
+
+    click.echo("")
+    click.echo("%-14s %6s %9s %9s %9s %9s" % ("", "count", "p50", "p90", "p99", "max"))
+    for name, s in sorted(instrumentation.summary().items()):
+        click.echo("%-14s %6s %8.4fs %8.4fs %8.4fs %8.4fs" % (name, s['count'], s['p50'], s['p90'], s['p99'], s['max']))
+    if instrument_file:
+        instrumentation.dump(instrument_file)
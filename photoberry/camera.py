@@ -1,20 +1,255 @@
 
+from io import BytesIO
+from logging import debug, info
 import os
-import picamera
+from PIL import Image
 from shutil import rmtree
 from tempfile import mkstemp, mkdtemp
 
-from time import sleep
+from time import sleep, time
 
+from . import instrumentation
+from .ui import align_up
 
-class CameraController(object):
+CAPTURE_JPEG    = "jpeg"
+CAPTURE_RAW     = "raw"
+
+
+class CameraBackend(object):
+    """
+    The interface between :class:`CameraController` and a camera.  It mirrors
+    the parts of :class:`~picamera.camera.PiCamera` that photoberry uses.
+    """
+
+    rotation = 0
+
+    @property
+    def resolution(self):
+        """
+        The resolution of captured photos in (width, height)
+        """
+        raise NotImplementedError()
+
+    @resolution.setter
+    def resolution(self, resolution):
+        raise NotImplementedError()
+
+    def start_preview(self, **options):
+        """
+        Starts the preview.
+        :param options: See :meth:`~picamera.camera.PiCamera.start_preview`
+        :return: the preview renderer
+        """
+        raise NotImplementedError()
+
+    def add_overlay(self, source, size=None, **options):
+        """
+        Adds an overlay
+        :param source: the source
+        :param size: the size of the source
+        :param options: See :meth:`~picamera.camera.PiCamera.add_overlay`
+        :return: the overlay renderer
+        """
+        raise NotImplementedError()
+
+    def capture(self, output, format=None, use_video_port=False, **options):
+        """
+        Captures a photo
+        :param output: the file like object to write the photo to
+        :param format: the format, 'jpeg' or 'rgba'
+        :param use_video_port: capture from the video port
+        :param options: See :meth:`~picamera.camera.PiCamera.capture`
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """
+        Releases the camera
+        """
+        pass
+
+
+class PiCameraBackend(CameraBackend):
+    """
+    The Raspberry Pi camera module, using picamera
+    """
 
     def __init__(self):
+        import picamera
+        self.camera = picamera.PiCamera()
+
+    @property
+    def rotation(self):
+        return self.camera.rotation
+
+    @rotation.setter
+    def rotation(self, rotation):
+        self.camera.rotation = rotation
+
+    @property
+    def resolution(self):
+        return self.camera.resolution
+
+    @resolution.setter
+    def resolution(self, resolution):
+        self.camera.resolution = resolution
+
+    def start_preview(self, **options):
+        return self.camera.start_preview(**options)
+
+    def add_overlay(self, source, size=None, **options):
+        return self.camera.add_overlay(source, size=size, **options)
+
+    def capture(self, output, format=None, use_video_port=False, **options):
+        self.camera.capture(output, format=format, use_video_port=use_video_port, **options)
+
+    def close(self):
+        self.camera.close()
+
+
+class SyntheticRenderer(object):
+    """
+    A stand in for picamera's preview and overlay renderers
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.updates = 0
+
+    def update(self, source):
+        self.updates += 1
+
+
+class SyntheticCameraBackend(CameraBackend):
+    """
+    A camera that generates its photos, for running and profiling photoberry
+    on machines without a camera module.  Photos are generated once per
+    format and size and every capture then only costs `latency` seconds plus
+    writing the photo to its output.
+    """
+
+    def __init__(self, latency=0.0, screen_resolution=(1280, 720)):
+        """
+        :param latency: the number of seconds that each capture takes
+        :param screen_resolution: the size of fullscreen renderers
+        """
+        self.latency = latency
+        self.screen_resolution = screen_resolution
+        self._resolution = (1640, 1232)
+        self._frames = dict()
+
+    @property
+    def resolution(self):
+        return self._resolution
+
+    @resolution.setter
+    def resolution(self, resolution):
+        self._resolution = tuple(resolution)
+        self._frames = dict()
+
+    def start_preview(self, **options):
+        return SyntheticRenderer(options.get('window') or (0, 0) + tuple(self.screen_resolution))
+
+    def add_overlay(self, source, size=None, **options):
+        return SyntheticRenderer(options.get('window') or (0, 0) + tuple(self.screen_resolution))
+
+    def capture(self, output, format=None, use_video_port=False, **options):
+        sleep(self.latency)
+        output.write(self._frame(format or 'jpeg', options.get('resize')))
+
+    def _frame(self, format, resize):
+        key = (format, resize)
+        if key not in self._frames:
+            size = resize or self.resolution
+            bands = [
+                Image.effect_mandelbrot(size, (-2.0 + (0.2 * i), -1.2, 1.0, 1.2), 64)
+                for i in range(0, 3)
+            ]
+            image = Image.merge('RGB', bands)
+            if format == 'rgba':
+                # raw frames are padded out like the camera module's
+                frame = Image.new('RGBA', (align_up(size[0], 32), align_up(size[1], 16)))
+                frame.paste(image, box=(0, 0))
+                self._frames[key] = frame.tobytes()
+            else:
+                stream = BytesIO()
+                image.save(stream, format=format, quality=100)
+                self._frames[key] = stream.getvalue()
+        return self._frames[key]
+
+
+class FrameBuffer(object):
+    """
+    A preallocated buffer that the camera writes unencoded RGBA frames into.
+    The buffer's memory is shared with `image`, so a captured frame can be
+    used without being decoded or copied.
+    """
+
+    def __init__(self, size):
+        """
+        :param size: the (width, height) of the frames
+        """
+        self.size = size
+        # the camera pads raw frames out to a width that's a multiple of 32 and
+        # a height that's a multiple of 16
+        self.stride = align_up(size[0], 32) * 4
+        self._data = bytearray(self.stride * align_up(size[1], 16))
+        self._view = memoryview(self._data)
+        self._position = 0
+        self.image = Image.frombuffer('RGBA', size, self._data, 'raw', 'RGBA', self.stride, 1)
+
+    def rewind(self):
+        """
+        Prepares the buffer to receive a new frame.
+        """
+        self._position = 0
+
+    def write(self, data):
+        """
+        Called by the camera with the frame's data.
+        :param data: a chunk of the frame
+        :return: the number of bytes written
+        """
+        length = min(len(data), len(self._data) - self._position)
+        self._view[self._position:self._position + length] = data[:length]
+        self._position += length
+        return length
+
+    def flush(self):
+        pass
+
+
+class CameraController(object):
+
+    def __init__(self, in_memory=False, work_dir_root=None, capture_format=CAPTURE_JPEG,
+                 capture_size=None, frame_buffer_count=4, use_video_port=False, backend=None):
+        """
+        :param in_memory: capture photos to in memory buffers rather than files
+        :param work_dir_root: the directory to create working directories in, for
+            instance a tmpfs mount, defaults to the system's temporary directory
+        :param capture_format: CAPTURE_JPEG or CAPTURE_RAW
+        :param capture_size: the size that the camera resizes raw captures to
+        :param frame_buffer_count: the number of frame buffers raw captures rotate through
+        :param use_video_port: capture from the video port, which avoids the still
+            port's mode switch at the cost of some image quality
+        :param backend: the :class:`CameraBackend`, defaults to :class:`PiCameraBackend`
+        """
         self._camera = None
         self.preview_renderer = None
+        self.in_memory = in_memory
+        self.work_dir_root = work_dir_root
         self.work_dir = None
+        self.capture_format = capture_format
+        self.capture_size = capture_size
+        self.use_video_port = use_video_port
+        self.last_shutter_lag = None
+        self.last_capture_time = None
+        self._frame_buffers = list()
+        self._frame_buffer_index = 0
+        if capture_format == CAPTURE_RAW:
+            self._frame_buffers = [FrameBuffer(capture_size) for _ in range(frame_buffer_count)]
         self.clear_workdir()
-        self.camera = picamera.PiCamera()
+        self.camera = backend or PiCameraBackend()
 
     def start_preview(self, **options):
         """
@@ -24,16 +259,7 @@ class CameraController(object):
 
         self.camera.rotation = 180
         self.preview_renderer = self.camera.start_preview(**options)
-
-        wait = 0
-        while True:
-            if self.preview_renderer.window[2] > 0:
-                break
-            wait += 1
-            if wait > 10:
-                raise RuntimeError('Waited longer than 10 seconds for preview window')
-            sleep(1)
-
+        self._wait_for_window(self.preview_renderer, 'preview')
         return self.preview_renderer
 
     def add_overlay(self, source, size=None, **options):
@@ -45,35 +271,107 @@ class CameraController(object):
         """
 
         overlay = self.camera.add_overlay(source, size=size, **options)
-
-        wait = 0
-        while True:
-            if overlay.window[2] > 0:
-                break
-            wait += 1
-            if wait > 10:
-                raise RuntimeError('Waited longer than 10 seconds for overlay window')
-            sleep(1)
+        self._wait_for_window(overlay, 'overlay')
 
         return overlay
 
+    def _wait_for_window(self, renderer, name, timeout=10, interval=0.005):
+        """
+        Waits for a renderer's window to be laid out.
+        :param renderer: the renderer
+        :param name: the name of the renderer, for logging
+        :param timeout: the maximum number of seconds to wait
+        :param interval: the number of seconds between checks
+        :return: the number of seconds waited
+        """
+        start = time()
+        deadline = start + timeout
+        while renderer.window[2] <= 0:
+            if time() > deadline:
+                raise RuntimeError('Waited longer than ' + str(timeout) + ' seconds for ' + name + ' window')
+            sleep(interval)
+        waited = time() - start
+        debug("waited %.3fs for %s window", waited, name)
+        return waited
+
     def clear_workdir(self):
         """
-        Deletes all files in the working directory
+        Deletes all files in the working directory.  A new one is only
+        created when photos are captured to files.
+        :return: the working directory, or None if there isn't one
         """
+        self._remove_workdir()
+        if not self.in_memory and self.capture_format != CAPTURE_RAW:
+            self.work_dir = mkdtemp('work', 'photoberry', dir=self.work_dir_root)
+        return self.work_dir
+
+    def _remove_workdir(self):
         if self.work_dir and os.path.exists(self.work_dir):
             rmtree(self.work_dir, ignore_errors=True)
-        self.work_dir = mkdtemp('work', 'photoberry')
-        return self.work_dir
+        self.work_dir = None
+
+    def close(self):
+        """
+        Releases the camera and deletes the working directory
+        """
+        self.camera.close()
+        self._remove_workdir()
+
+    def capture_photo(self, deadline=None):
+        """
+        Captures a photo to a temporary file in the working directory, or to
+        an in memory buffer if in_memory is set
+        :param deadline: the time, as returned by :func:`time.time`, to take the
+            photo at.  If given, the capture waits for it and the shutter lag
+            is measured from it.
+        :return: the file name or buffer, or an image when capturing raw frames
+        """
+        if deadline:
+            delay = deadline - time()
+            if delay > 0:
+                sleep(delay)
+        start = time()
+
+        if self.capture_format == CAPTURE_RAW:
+            ret = self._capture_frame()
+
+        elif self.in_memory:
+            ret = BytesIO()
+            self._capture(ret, format='jpeg', quality=100)
+            ret.seek(0)
+
+        else:
+            (handle, ret) = mkstemp(suffix='.jpg', prefix='photoberry-temp', dir=self.work_dir)
+            os.close(handle)
+            handle = open(ret, 'wb')
+            self._capture(handle, format='jpeg', quality=100)
+            handle.close()
+
+        end = time()
+        self.last_capture_time = end - start
+        self.last_shutter_lag = end - (deadline or start)
+        instrumentation.record(instrumentation.CAPTURE, self.last_capture_time)
+        instrumentation.record(instrumentation.SHUTTER_LAG, self.last_shutter_lag)
+        info("shutter lag: %.3fs (trigger: %.3fs, capture: %.3fs, video port: %s)",
+             self.last_shutter_lag, start - (deadline or start), end - start, self.use_video_port)
+        return ret
+
+    def _capture(self, output, **options):
+        """
+        Captures from the still port, or from the video port if use_video_port is set
+        :param output: the output
+        :param options: See :meth:`~picamera.camera.PiCamera.capture`
+        """
+        self.camera.capture(output, use_video_port=self.use_video_port, **options)
 
-    def capture_photo(self):
+    def _capture_frame(self):
         """
-        Captures a photo to a temporary file in the working directory
-        :return: the file
+        Captures an unencoded frame, resized by the camera to capture_size, into
+        the next of the preallocated frame buffers.
+        :return: an image that shares the frame buffer's memory
         """
-        (handle, file_name) = mkstemp(suffix='.jpg', prefix='photoberry-temp', dir=self.work_dir)
-        os.close(handle)
-        handle = open(file_name, 'wb')
-        self.camera.capture(handle, format='jpeg', quality=100)
-        handle.close()
-        return file_name
+        frame_buffer = self._frame_buffers[self._frame_buffer_index]
+        self._frame_buffer_index = (self._frame_buffer_index + 1) % len(self._frame_buffers)
+        frame_buffer.rewind()
+        self._capture(frame_buffer, format='rgba', resize=frame_buffer.size)
+        return frame_buffer.image
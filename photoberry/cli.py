@@ -2,11 +2,11 @@
 import click
 import logging
 import photoberry
+from photoberry.strip import PrintProfile, PRINT_PROFILES
 
 logging.basicConfig(format='[%(asctime)s] %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p')
 
-default_print_command = 'lpr ' \
-                        '-r ' \
+default_print_command = 'lp ' \
                         '-o fit-to-page ' \
                         '-o position=center ' \
                         '{filename}'
@@ -15,10 +15,24 @@ default_print_command = 'lpr ' \
 @click.command()
 @click.option('--photo-resolution', nargs=2, type=click.Tuple([int, int]), default=(1640, 1232))
 @click.option('--strip-resolution-ratio', nargs=1, type=float, default=0.75)
+@click.option('--strip-quality', type=click.Choice(['fast', 'exact']), default='exact')
+@click.option('--capture-format', type=click.Choice(['jpeg', 'raw']), default='jpeg')
+@click.option('--use-video-port', is_flag=True)
 @click.option('--debug', is_flag=True)
-@click.option('--yes-gpio-pin', nargs=1, type=int, prompt=True)
-@click.option('--no-gpio-pin', nargs=1, type=int, prompt=True)
-@click.option('--print-command', nargs=1, type=str, default=default_print_command)
+@click.option('--input-backend', type=click.Choice(['gpio', 'keyboard', 'evdev', 'script']), default='gpio')
+@click.option('--yes-gpio-pin', nargs=1, type=int)
+@click.option('--no-gpio-pin', nargs=1, type=int)
+@click.option('--yes-key', nargs=1, type=str)
+@click.option('--no-key', nargs=1, type=str)
+@click.option('--input-device', nargs=1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--input-script', nargs=1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--input-record', nargs=1, type=click.Path(dir_okay=False, writable=True))
+@click.option('--print-command', nargs=1, type=str)
+@click.option('--print-profile', type=click.Choice(sorted(PRINT_PROFILES.keys())))
+@click.option('--print-margin', nargs=1, type=float)
+@click.option('--printer-icc-profile', nargs=1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--print-workers', nargs=1, type=click.IntRange(min=1), default=1)
+@click.option('--print-retries', nargs=1, type=click.IntRange(min=0), default=1)
 @click.option('--twitter-consumer-key', nargs=1, type=str)
 @click.option('--twitter-consumer-secret', nargs=1, type=str)
 @click.option('--twitter-access-token-key', nargs=1, type=str)
@@ -26,12 +40,19 @@ default_print_command = 'lpr ' \
 @click.option('--twitter-text', nargs=1, type=str, default="Created and uploaded with #photoberry")
 @click.option('--twitter-disable-banner', is_flag=True, default=False)
 @click.option('--disable-quit', is_flag=True)
+@click.option('--in-memory', is_flag=True)
+@click.option('--work-dir', nargs=1, type=click.Path(exists=True, file_okay=False))
+@click.option('--instrument', is_flag=True)
+@click.option('--instrument-file', nargs=1, type=click.Path(dir_okay=False, writable=True))
 @click.option('--debug', is_flag=True)
-def main(photo_resolution, strip_resolution_ratio, debug, yes_gpio_pin, no_gpio_pin, print_command,
+def main(photo_resolution, strip_resolution_ratio, strip_quality, capture_format, use_video_port, debug,
+         input_backend, yes_gpio_pin, no_gpio_pin, yes_key, no_key, input_device, input_script, input_record,
+         print_command,
          twitter_consumer_key, twitter_consumer_secret, twitter_access_token_key, twitter_access_token_secret,
          twitter_text,
          twitter_disable_banner,
-         disable_quit):
+         disable_quit, in_memory, work_dir, instrument, instrument_file, print_workers, print_retries,
+         print_profile, print_margin, printer_icc_profile):
     """
     Photo booth application for the Rapsberry Pi written in Python
     """
@@ -42,11 +63,55 @@ def main(photo_resolution, strip_resolution_ratio, debug, yes_gpio_pin, no_gpio_
     else:
         logger.setLevel(logging.INFO)
 
+    photoberry.instrumentation.enable(instrument or bool(instrument_file))
+
+    if input_backend == 'gpio':
+        if yes_gpio_pin is None or no_gpio_pin is None:
+            raise click.UsageError("--yes-gpio-pin and --no-gpio-pin are required with --input-backend gpio")
+        # the GPIO backend is created by the app, RPi.GPIO only imports on a Pi
+        input_backend = None
+    elif input_backend == 'keyboard':
+        input_backend = photoberry.input.KeyboardInputBackend({
+            photoberry.BUTTON_YES: yes_key or 'y',
+            photoberry.BUTTON_NO: no_key or 'n'})
+    elif input_backend == 'evdev':
+        input_backend = photoberry.input.EvdevInputBackend({
+            photoberry.BUTTON_YES: yes_key or 'KEY_Y',
+            photoberry.BUTTON_NO: no_key or 'KEY_N'}, device=input_device)
+    elif input_backend == 'script':
+        if not input_script:
+            raise click.UsageError("--input-script is required with --input-backend script")
+        input_backend = photoberry.input.ScriptedInputBackend(photoberry.input.load_script(input_script))
+
+    if print_profile:
+        print_profile = PRINT_PROFILES[print_profile]
+        if print_margin is not None:
+            print_profile = PrintProfile(print_profile.page_size, print_profile.dpi, margin=print_margin,
+                                         columns=print_profile.columns, padding=print_profile.padding,
+                                         media=print_profile.media)
+    elif print_margin is not None:
+        raise click.UsageError("--print-margin needs a --print-profile")
+
+    # strips rendered for a print profile are printed as they are, without fitting them to the page
+    if not print_command:
+        print_command = print_profile.print_command() if print_profile else default_print_command
+
     app = photoberry.PhotoBerryApplication(
         photo_resolution, strip_resolution_ratio,
         yes_gpio_pin, no_gpio_pin,
         print_command,
         disable_quit=disable_quit,
+        strip_quality=strip_quality,
+        in_memory=in_memory,
+        work_dir=work_dir,
+        capture_format=capture_format,
+        use_video_port=use_video_port,
+        input_backend=input_backend,
+        input_record=input_record,
+        print_workers=print_workers,
+        print_retries=print_retries,
+        print_profile=print_profile,
+        printer_icc_profile=printer_icc_profile,
         twitter_credentials=photoberry.TwitterCredentials(
             twitter_consumer_key,
             twitter_consumer_secret,
@@ -55,4 +120,10 @@ def main(photo_resolution, strip_resolution_ratio, debug, yes_gpio_pin, no_gpio_
             twitter_text),
         twitter_disable_banner=twitter_disable_banner)
 
-    app.run()
+    try:
+        app.run()
+    finally:
+        if photoberry.instrumentation.enabled:
+            photoberry.instrumentation.log_summary()
+            if instrument_file:
+                photoberry.instrumentation.dump(instrument_file)
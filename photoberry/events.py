@@ -0,0 +1,212 @@
+
+from collections import deque
+import threading
+from time import time
+
+EVENT_PRESS         = "press"
+EVENT_RELEASE       = "release"
+EVENT_LONG_PRESS    = "long_press"
+
+
+class InputEvent(object):
+    """
+    Something that happened to a button, and when
+    """
+
+    def __init__(self, button, kind, timestamp):
+        """
+        :param button: the name of the button
+        :param kind: one of EVENT_PRESS, EVENT_RELEASE or EVENT_LONG_PRESS
+        :param timestamp: the time, as returned by :func:`time.time`, of the edge
+        """
+        self.button = button
+        self.kind = kind
+        self.timestamp = timestamp
+
+    @property
+    def latency(self):
+        """
+        The number of seconds since the event happened
+        """
+        return time() - self.timestamp
+
+    def __repr__(self):
+        return "InputEvent(" + str(self.button) + ", " + str(self.kind) + ", " + str(self.timestamp) + ")"
+
+
+class InputQueue(object):
+    """
+    A thread safe queue of input events, in the order that they happened.
+    Buttons put events on it from whatever thread they are detected on and
+    the UI loop takes them off.  A button that is held for long_press_duration
+    also gets a long press event, between its press and its release.
+    """
+
+    def __init__(self, long_press_duration=2.0, callback=None):
+        """
+        :param long_press_duration: the number of seconds a button is held for a long press
+        :param callback: called, from the thread that put it, after every event
+        """
+        self.long_press_duration = long_press_duration
+        self.callback = callback
+        self._events = deque()
+        self._held = dict()
+        self._lock = threading.Lock()
+
+    def put(self, button, kind, timestamp=None):
+        """
+        Adds an event to the queue
+        :param button: the name of the button
+        :param kind: one of EVENT_PRESS or EVENT_RELEASE
+        :param timestamp: the time of the edge, defaults to now
+        """
+        if timestamp is None:
+            timestamp = time()
+        with self._lock:
+            self._add_long_presses(timestamp)
+            if kind == EVENT_PRESS:
+                self._held[button] = timestamp
+            elif kind == EVENT_RELEASE:
+                self._held.pop(button, None)
+            self._events.append(InputEvent(button, kind, timestamp))
+        if self.callback:
+            self.callback()
+
+    def get(self):
+        """
+        Takes the oldest event off the queue
+        :return: the event, or None if there are none
+        """
+        with self._lock:
+            self._add_long_presses(time())
+            if not self._events:
+                return None
+            return self._events.popleft()
+
+    def next_deadline(self):
+        """
+        Returns when the next long press will happen, if a button is held
+        :return: the time, or None
+        """
+        with self._lock:
+            pressed = [t for t in self._held.values() if t is not None]
+        if not pressed:
+            return None
+        return min(pressed) + self.long_press_duration
+
+    def clear(self):
+        """
+        Drops all events that haven't been taken yet
+        """
+        with self._lock:
+            self._events.clear()
+
+    def __len__(self):
+        return len(self._events)
+
+    def _add_long_presses(self, now):
+        for button, pressed in sorted(self._held.items(), key=lambda h: h[1] or 0):
+            if pressed is not None and now - pressed >= self.long_press_duration:
+                self._events.append(InputEvent(button, EVENT_LONG_PRESS, pressed + self.long_press_duration))
+                self._held[button] = None
+
+
+class Button(object):
+    """
+    A button that debounces its edges and puts them on an input queue.
+    Subclasses call :meth:`_edge` whenever the button might have changed.
+    Subclasses that can read the button implement :meth:`_read`, an edge
+    that is rejected then has the button read again once the debounce is
+    over, so that a change hidden in a bounce isn't lost.
+    """
+
+    def __init__(self, name, queue, debounce=0.02):
+        """
+        :param name: the name of the button, events carry it
+        :param queue: the input queue
+        :param debounce: edges closer than this many seconds to the last one are ignored
+        """
+        self.name = name
+        self.debounce = debounce
+        self._queue = queue
+        self._lock = threading.Lock()
+        self._pressed = False
+        self._last_edge = None
+        self._resample = None
+        self._was_pressed = False
+        self._was_released = False
+
+    def _read(self):
+        """
+        Reads the button
+        :return: True if the button is pressed, or None if it can't be read
+        """
+        return None
+
+    def _edge(self, pressed, timestamp=None):
+        """
+        Records a change of the button
+        :param pressed: True if the button is now pressed
+        :param timestamp: the time of the edge, defaults to now
+        :return: True if the edge was accepted, False if it was a bounce
+        """
+        if timestamp is None:
+            timestamp = time()
+        with self._lock:
+            if pressed == self._pressed:
+                return False
+            if self._last_edge is not None and timestamp - self._last_edge < self.debounce:
+                self._schedule_resample()
+                return False
+            self._pressed = pressed
+            self._last_edge = timestamp
+            if pressed:
+                self._was_pressed = True
+            else:
+                self._was_released = True
+            self._queue.put(self.name, EVENT_PRESS if pressed else EVENT_RELEASE, timestamp)
+            return True
+
+    def _schedule_resample(self):
+        if self._resample is not None:
+            return
+        delay = max(0.0, self._last_edge + self.debounce - time())
+        self._resample = threading.Timer(delay, self._on_resample)
+        self._resample.daemon = True
+        self._resample.start()
+
+    def _on_resample(self):
+        with self._lock:
+            self._resample = None
+        pressed = self._read()
+        if pressed is not None:
+            self._edge(pressed)
+
+    @property
+    def was_pressed(self):
+        """
+        Checks as to whether or not the button was pressed, also
+        clearing the flag if it was in fact pressed.
+        :return: True if pressed, False otherwise
+        """
+        ret = self._was_pressed
+        self._was_pressed = False
+        return ret
+
+    @property
+    def was_released(self):
+        """
+        Checks as to whether or not the button was released, also
+        clearing the flag if it was in fact released.
+        :return: True if released, False otherwise
+        """
+        ret = self._was_released
+        self._was_released = False
+        return ret
+
+    @property
+    def pressed(self):
+        """
+        Whether or not the button is held down, as of its last accepted edge
+        """
+        return self._pressed
@@ -1,53 +1,52 @@
-
 import RPi.GPIO as GPIO
 
-GPIO.setmode(GPIO.BCM)
+from .events import Button
+from .input import InputBackend
 
 
-class GPIOButton(object):
+class GPIOButton(Button):
     """
     A simple button that uses GPIO
     """
 
-    def __init__(self, pin):
+    def __init__(self, name, queue, pin, debounce=0.02):
+        """
+        :param name: the name of the button, events carry it
+        :param queue: the input queue that events are put on
+        :param pin: the BCM pin number
+        :param debounce: edges closer than this many seconds to the last one are ignored
+        """
+        super(GPIOButton, self).__init__(name, queue, debounce=debounce)
+        self._pin = pin
         GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
         GPIO.add_event_detect(pin, GPIO.BOTH, callback=self._gpio_event)
-        self._pin = pin
-        self._pressed = False
-        self._was_pressed = False
-        self._was_released = False
+
+    def _read(self):
+        return GPIO.input(self._pin) == False
 
     def _gpio_event(self, pin):
         if pin != self._pin:
             return
-        self._was_pressed = self.pressed
-        self._was_released = not self._was_pressed
+        self._edge(self._read())
 
-    @property
-    def was_pressed(self):
-        """
-        Checks as to whether or not the button was released, also
-        clearing the flag if it was in fact released.
-        :return: True if released, False otherwise
-        """
-        ret = self._was_released
-        self._was_pressed = False
-        self._was_released = False
-        return ret
 
-    @property
-    def was_pressed(self):
+class GPIOInputBackend(InputBackend):
+    """
+    Buttons wired to the Raspberry Pi's GPIO pins, pulled up and pressed
+    when they are shorted to ground.
+    """
+
+    def __init__(self, pins, debounce=0.02):
         """
-        Checks as to whether or not the button was pressed, also
-        clearing the flag if it was in fact pressed.
-        :return: True if pressed, False otherwise
+        :param pins: a dict of button name to BCM pin number
+        :param debounce: edges closer than this many seconds to the last one are ignored
         """
-        ret = self._was_pressed
-        self._was_pressed = False
-        self._was_released = False
-        return ret
+        self._pins = pins
+        self._debounce = debounce
+        GPIO.setmode(GPIO.BCM)
 
-    @property
-    def pressed(self):
-        return GPIO.input(self._pin) == False
+    def create_button(self, name, queue):
+        return GPIOButton(name, queue, self._pins[name], debounce=self._debounce)
 
+    def close(self):
+        GPIO.cleanup(list(self._pins.values()))
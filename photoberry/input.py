@@ -0,0 +1,254 @@
+
+from logging import debug, info
+import os
+import select
+import sys
+import threading
+from time import time
+
+from .events import Button, EVENT_PRESS, EVENT_RELEASE
+
+# a tap is a press followed right away by a release, terminals only report
+# key presses and scripts use it as a shorthand
+EVENT_TAP = "tap"
+
+
+class InputBackend(object):
+    """
+    The interface between the application and whatever its buttons are.
+    Buttons are created first and the backend is then started, backends
+    that read their input on a thread only start reading then.
+    """
+
+    def create_button(self, name, queue):
+        """
+        Creates a button
+        :param name: the name of the button, events carry it
+        :param queue: the input queue that the button's events are put on
+        :return: the button
+        """
+        raise NotImplementedError()
+
+    def start(self):
+        """
+        Starts delivering events
+        """
+        pass
+
+    def close(self):
+        """
+        Stops delivering events and releases the input devices
+        """
+        pass
+
+
+class _ThreadedInputBackend(InputBackend):
+    """
+    A backend that reads its input on a daemon thread
+    """
+
+    def __init__(self):
+        self._buttons = dict()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def create_button(self, name, queue):
+        button = Button(name, queue, debounce=0)
+        self._buttons[name] = button
+        return button
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='photoberry-input')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def close(self):
+        self._stopped.set()
+
+    def _run(self):
+        raise NotImplementedError()
+
+    def _tap(self, button, timestamp=None):
+        if timestamp is None:
+            timestamp = time()
+        button._edge(True, timestamp)
+        button._edge(False, timestamp)
+
+
+class KeyboardInputBackend(_ThreadedInputBackend):
+    """
+    Keys typed on the terminal.  Terminals don't report key releases, so
+    every key is a tap and buttons can't be held.
+    """
+
+    def __init__(self, keys):
+        """
+        :param keys: a dict of button name to the character that taps it
+        """
+        super(KeyboardInputBackend, self).__init__()
+        self._keys = dict((key, name) for name, key in keys.items())
+        self._terminal = None
+
+    def start(self):
+        if sys.stdin.isatty():
+            import termios
+            import tty
+            self._terminal = termios.tcgetattr(sys.stdin)
+            tty.setcbreak(sys.stdin.fileno())
+        info("keyboard input: %s", ", ".join(k + "=" + n for k, n in sorted(self._keys.items())))
+        super(KeyboardInputBackend, self).start()
+
+    def close(self):
+        super(KeyboardInputBackend, self).close()
+        if self._terminal:
+            import termios
+            termios.tcsetattr(sys.stdin, termios.TCSADRAIN, self._terminal)
+            self._terminal = None
+
+    def _run(self):
+        fd = sys.stdin.fileno()
+        while not self._stopped.is_set():
+            if not select.select([fd], [], [], 0.5)[0]:
+                continue
+            key = os.read(fd, 1).decode('utf-8', 'ignore')
+            if not key:
+                return
+            name = self._keys.get(key.lower())
+            if name:
+                self._tap(self._buttons[name])
+
+
+class EvdevInputBackend(_ThreadedInputBackend):
+    """
+    Keys of a Linux input device, such as a USB keyboard or an arcade button
+    encoder, read with evdev.  Presses and releases are timestamped by the
+    kernel.
+    """
+
+    def __init__(self, keys, device=None):
+        """
+        :param keys: a dict of button name to key name, for instance 'KEY_Y'
+        :param device: the path of the input device, defaults to the first
+            device that has all of the keys
+        """
+        import evdev
+        super(EvdevInputBackend, self).__init__()
+        self._codes = dict((evdev.ecodes.ecodes[key], name) for name, key in keys.items())
+        if device:
+            self._device = evdev.InputDevice(device)
+        else:
+            self._device = self._find_device(evdev)
+        info("evdev input: %s", self._device)
+
+    def _find_device(self, evdev):
+        for path in evdev.list_devices():
+            device = evdev.InputDevice(path)
+            if set(self._codes).issubset(device.capabilities().get(evdev.ecodes.EV_KEY, [])):
+                return device
+            device.close()
+        raise RuntimeError("There is no input device with the keys " + str(sorted(self._codes.values())))
+
+    def close(self):
+        super(EvdevInputBackend, self).close()
+        self._device.close()
+
+    def _run(self):
+        import evdev
+        try:
+            while not self._stopped.is_set():
+                if not select.select([self._device.fd], [], [], 0.5)[0]:
+                    continue
+                for event in self._device.read():
+                    # value is 1 for down, 0 for up and 2 for auto repeat
+                    if event.type != evdev.ecodes.EV_KEY or event.value == 2:
+                        continue
+                    name = self._codes.get(event.code)
+                    if name:
+                        self._buttons[name]._edge(event.value == 1, event.timestamp())
+        except (IOError, OSError) as e:
+            if not self._stopped.is_set():
+                info("input device closed: %s", e)
+
+
+class ScriptedInputBackend(_ThreadedInputBackend):
+    """
+    Replays a script of button events with exact timing, for load testing
+    the application and measuring its latency without any input hardware.
+    """
+
+    def __init__(self, script):
+        """
+        :param script: a list of (seconds since start, button name, kind)
+            where kind is EVENT_PRESS, EVENT_RELEASE or EVENT_TAP
+        """
+        super(ScriptedInputBackend, self).__init__()
+        self.script = sorted(script, key=lambda step: step[0])
+        self.finished = threading.Event()
+
+    def _run(self):
+        start = time()
+        try:
+            for offset, name, kind in self.script:
+                # wait for the step, stamping it with when it was due so that
+                # a late wake up shows up as latency
+                if self._stopped.wait(max(0.0, start + offset - time())):
+                    return
+                button = self._buttons[name]
+                if kind == EVENT_TAP:
+                    self._tap(button, start + offset)
+                else:
+                    button._edge(kind == EVENT_PRESS, start + offset)
+            debug("input script finished after %.3fs", time() - start)
+        finally:
+            self.finished.set()
+
+
+def load_script(file_name):
+    """
+    Loads an input script.  Every line of the file is a step of the form
+    `<seconds since start> <button> <press|release|tap>`, blank lines and
+    lines starting with # are ignored.
+    :param file_name: the file name
+    :return: the script, for :class:`ScriptedInputBackend`
+    """
+    script = list()
+    f = open(file_name, 'r')
+    for number, line in enumerate(f, 1):
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        parts = line.split()
+        if len(parts) != 3 or parts[2] not in (EVENT_PRESS, EVENT_RELEASE, EVENT_TAP):
+            f.close()
+            raise ValueError(file_name + ":" + str(number) + ": expected '<seconds> <button> <press|release|tap>'")
+        script.append((float(parts[0]), parts[1], parts[2]))
+    f.close()
+    return script
+
+
+class ScriptRecorder(object):
+    """
+    Writes the presses and releases that the application handles to a file
+    that :func:`load_script` can load, so that they can be replayed.
+    """
+
+    def __init__(self, file_name):
+        """
+        :param file_name: the file to write
+        """
+        self._file = open(file_name, 'w')
+        self._start = time()
+
+    def record(self, event):
+        """
+        Writes an event, long presses aren't written as they follow from the
+        press and release
+        :param event: the event
+        """
+        if event.kind not in (EVENT_PRESS, EVENT_RELEASE):
+            return
+        self._file.write("%.3f %s %s\n" % (event.timestamp - self._start, event.button, event.kind))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
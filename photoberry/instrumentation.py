@@ -0,0 +1,201 @@
+
+import json
+from logging import info
+import math
+import threading
+from time import time
+
+# the timings that are recorded
+TICK            = "tick"
+LAYOUT          = "layout"
+DRAW            = "draw"
+RENDER          = "render"
+CAPTURE         = "capture"
+SHUTTER_LAG     = "shutter_lag"
+DECODE          = "decode"
+COMPOSITE       = "composite"
+COLOR           = "color"
+ENCODE          = "encode"
+PRINT_SUBMIT    = "print_submit"
+PRINT           = "print"
+UPLOAD          = "upload"
+INPUT_LATENCY   = "input_latency"
+
+PERCENTILES = (50, 90, 99)
+
+# histogram buckets grow by 5% from 10us, so percentiles are within 5% of
+# the real value without keeping every sample
+BUCKET_MIN      = 0.00001
+BUCKET_GROWTH   = 1.05
+BUCKET_COUNT    = 340
+
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+enabled = False
+
+_histograms = dict()
+_lock = threading.Lock()
+
+
+class Histogram(object):
+    """
+    A histogram of durations in exponentially growing buckets.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = [0] * BUCKET_COUNT
+
+    def add(self, value):
+        """
+        Adds a duration to the histogram
+        :param value: the duration, in seconds
+        """
+        if value <= BUCKET_MIN:
+            index = 0
+        else:
+            index = min(int(math.log(value / BUCKET_MIN) / _LOG_GROWTH) + 1, BUCKET_COUNT - 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """
+        Returns the duration that the given percentage of durations are at most.
+        :param percent: the percentage, from 0 to 100
+        :return: the duration, or None if the histogram is empty
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                upper = BUCKET_MIN * (BUCKET_GROWTH ** index)
+                return max(self.min, min(upper, self.max))
+        return self.max
+
+    def summary(self):
+        """
+        Returns the count, mean, min, max and percentiles of the histogram
+        :return: a dict
+        """
+        summary = {
+            'count': self.count,
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max
+        }
+        for percent in PERCENTILES:
+            summary['p' + str(percent)] = self.percentile(percent)
+        return summary
+
+
+class _Timed(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time()
+        return self
+
+    def __exit__(self, *args):
+        record(self.name, time() - self.start)
+        return False
+
+
+class _NotTimed(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_not_timed = _NotTimed()
+
+
+def enable(value=True):
+    """
+    Turns recording on or off, while it's off recording is a no-op.
+    :param value: True to record timings
+    """
+    global enabled
+    enabled = value
+
+
+def record(name, seconds):
+    """
+    Records a duration, if recording is enabled.
+    :param name: the name of the timing
+    :param seconds: the duration
+    """
+    if not enabled:
+        return
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = Histogram()
+        histogram.add(seconds)
+
+
+def timed(name):
+    """
+    Returns a context manager that records how long its block takes.
+    :param name: the name of the timing
+    :return: the context manager
+    """
+    if not enabled:
+        return _not_timed
+    return _Timed(name)
+
+
+def reset():
+    """
+    Drops everything that was recorded
+    """
+    with _lock:
+        _histograms.clear()
+
+
+def summary():
+    """
+    Returns a summary of everything that was recorded
+    :return: a dict of timing name to the summary of its histogram
+    """
+    with _lock:
+        return dict((name, histogram.summary()) for name, histogram in _histograms.items())
+
+
+def log_summary():
+    """
+    Logs a line for each timing that was recorded
+    """
+    for name, s in sorted(summary().items()):
+        info("%-14s n=%-6s mean=%.4fs p50=%.4fs p90=%.4fs p99=%.4fs max=%.4fs",
+             name, s['count'], s['mean'], s['p50'], s['p90'], s['p99'], s['max'])
+
+
+def dump(file_name):
+    """
+    Writes a summary of everything that was recorded to a JSON file
+    :param file_name: the file name
+    """
+    f = open(file_name, 'w')
+    json.dump(summary(), f, indent=2, sort_keys=True)
+    f.close()
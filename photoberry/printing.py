@@ -0,0 +1,234 @@
+
+from logging import debug, error, info, warning
+import os
+import re
+import subprocess
+import threading
+from time import sleep, time
+
+from . import instrumentation
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+JOB_PENDING     = "pending"
+JOB_PRINTING    = "printing"
+JOB_DONE        = "done"
+JOB_FAILED      = "failed"
+JOB_CANCELLED   = "cancelled"
+
+# the number of jobs that are remembered after they're over
+MAX_FINISHED_JOBS = 100
+
+# what lp prints when CUPS has taken a job, for instance
+# "request id is printer-42 (1 file(s))"
+CUPS_REQUEST_ID = re.compile(r'request id is (\S+)')
+
+# lists the CUPS jobs that haven't finished printing, one per line starting with its id
+CUPS_PENDING_COMMAND = ['lpstat', '-W', 'not-completed', '-o']
+
+
+class PrintJob(object):
+    """
+    A strip waiting to be, or being, printed
+    """
+
+    def __init__(self, job_id, file_name):
+        """
+        :param job_id: the id of the job
+        :param file_name: the strip's file name
+        """
+        self.id = job_id
+        self.file_name = file_name
+        self.status = JOB_PENDING
+        self.attempts = 0
+        self.returncode = None
+        self.cups_id = None
+        self.submitted = time()
+        self.finished = None
+
+    @property
+    def done(self):
+        """
+        Indicates whether or not the job is over, whether it printed or not
+        """
+        return self.status in (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+    def __repr__(self):
+        return "PrintJob(" + str(self.id) + ", " + self.status + ", " + self.file_name + ")"
+
+
+class PrintQueue(object):
+    """
+    Runs the print command for strips on a bounded number of worker threads,
+    so that sessions don't wait for the printer and the printer isn't sent
+    more than it can take at once.  Every command is waited for, failed
+    commands are retried, and a strip's file is removed once it printed or
+    was cancelled.  Strips that failed to print are kept so that they can be
+    printed by hand.
+
+    CUPS' lp exits as soon as the job is spooled, so when the command prints
+    a CUPS request id the job is followed with lpstat until the printer has
+    finished it.  A job is only over, and its worker free for the next one,
+    once it's off the printer.
+    """
+
+    def __init__(self, command, workers=1, retries=1, retry_delay=5.0, poll_interval=2.0):
+        """
+        :param command: the print command, {filename} is replaced with the strip's file name
+        :param workers: the number of jobs that are printed at once
+        :param retries: the number of times a failed job is retried
+        :param retry_delay: the number of seconds to wait before retrying
+        :param poll_interval: the number of seconds between checks of a CUPS job
+        """
+        self.command = command
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._jobs = dict()
+        self._next_id = 1
+        self._threads = list()
+        for i in range(0, workers):
+            thread = threading.Thread(target=self._run, name='photoberry-print-' + str(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, file_name):
+        """
+        Queues a strip to be printed, the queue owns the file from then on.
+        :param file_name: the strip's file name
+        :return: the job
+        """
+        with self._lock:
+            job = PrintJob(self._next_id, file_name)
+            self._next_id += 1
+            self._jobs[job.id] = job
+            finished = sorted(j.id for j in self._jobs.values() if j.done)
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[job_id]
+        self._queue.put(job)
+        info("queued print job %s, %s in the queue", job.id, self.depth)
+        return job
+
+    def cancel(self, job_id):
+        """
+        Cancels a job that hasn't been sent to the printer yet.
+        :param job_id: the id of the job
+        :return: True if the job was cancelled, False if it was already printing or over
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JOB_PENDING:
+                return False
+            self._finish(job, JOB_CANCELLED)
+        info("cancelled print job %s", job_id)
+        return True
+
+    def job(self, job_id):
+        """
+        Returns a job
+        :param job_id: the id of the job
+        :return: the job, or None if there isn't one with that id
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @property
+    def depth(self):
+        """
+        The number of jobs that are waiting or printing
+        """
+        with self._lock:
+            return len([job for job in self._jobs.values() if not job.done])
+
+    def close(self, timeout=None):
+        """
+        Waits for the queued jobs to print and stops the workers.
+        :param timeout: the number of seconds to wait, or None to wait forever
+        :return: True if every job is over
+        """
+        depth = self.depth
+        if depth:
+            info("waiting for %s print jobs", depth)
+        self._closed.set()
+        for i in range(0, len(self._threads)):
+            self._queue.put(None)
+        deadline = time() + timeout if timeout is not None else None
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time()))
+        depth = self.depth
+        if depth:
+            warning("%s print jobs were not printed", depth)
+        return depth == 0
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.status != JOB_PENDING:
+                    continue
+                job.status = JOB_PRINTING
+            self._print(job)
+
+    def _print(self, job):
+        start = time()
+        args = self.command.replace('{filename}', job.file_name).split()
+        while True:
+            job.attempts += 1
+            try:
+                process = subprocess.Popen(args, stdout=subprocess.PIPE)
+                output = process.communicate()[0]
+                job.returncode = process.returncode
+            except OSError as e:
+                error("unable to run print command: %s", e)
+                job.returncode = -1
+            if job.returncode == 0:
+                match = CUPS_REQUEST_ID.search(output.decode('utf-8', 'replace'))
+                if match:
+                    job.cups_id = match.group(1)
+                    self._wait_for_printer(job)
+                break
+            error("print job %s exited with %s on attempt %s", job.id, job.returncode, job.attempts)
+            if job.attempts > self.retries:
+                break
+            # closing cuts the delay short rather than dropping the retry
+            self._closed.wait(self.retry_delay)
+
+        with self._lock:
+            self._finish(job, JOB_DONE if job.returncode == 0 else JOB_FAILED)
+        instrumentation.record(instrumentation.PRINT, time() - start)
+        if job.status == JOB_FAILED:
+            error("print job %s failed, the strip was kept at %s", job.id, job.file_name)
+        else:
+            info("print job %s done in %.3fs", job.id, time() - start)
+
+    def _wait_for_printer(self, job):
+        debug("print job %s is CUPS job %s", job.id, job.cups_id)
+        while True:
+            try:
+                process = subprocess.Popen(CUPS_PENDING_COMMAND, stdout=subprocess.PIPE)
+                output = process.communicate()[0]
+            except OSError as e:
+                warning("unable to follow CUPS job %s: %s", job.cups_id, e)
+                return
+            if process.returncode != 0:
+                warning("unable to follow CUPS job %s, lpstat exited with %s", job.cups_id, process.returncode)
+                return
+            pending = [line.split()[0] for line in output.decode('utf-8', 'replace').splitlines() if line.strip()]
+            if job.cups_id not in pending:
+                return
+            sleep(self.poll_interval)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time()
+        if status != JOB_FAILED and os.path.exists(job.file_name):
+            os.remove(job.file_name)
@@ -0,0 +1,485 @@
+
+from io import BytesIO
+from logging import debug, error
+import os
+from PIL import Image, ImageColor, ImageFilter
+from tempfile import mkstemp
+import threading
+from time import time
+
+from . import instrumentation
+
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
+
+QUALITY_FAST    = "fast"
+QUALITY_EXACT   = "exact"
+
+RESAMPLE_FILTERS = {
+    QUALITY_FAST: Image.BILINEAR,
+    QUALITY_EXACT: Image.LANCZOS
+}
+
+# ImageFilter.DETAIL followed by ImageFilter.SHARPEN, fused into a single
+# 5x5 convolution (the two 3x3 kernels convolved with each other)
+DETAIL_SHARPEN = ImageFilter.Kernel((5, 5), (
+    0,   2,   2,   2,   0,
+    2, -16, -48, -16,   2,
+    2, -48, 328, -48,   2,
+    2, -16, -48, -16,   2,
+    0,   2,   2,   2,   0
+), scale=96)
+
+
+def load_photo(source, size, quality=QUALITY_EXACT):
+    """
+    Decodes a captured photo at the given size.  JPEG sources are decoded
+    in draft mode so that libjpeg's DCT scaling does most of the downscaling
+    before the final resize.  Unencoded frames that are already the right
+    size are returned as they are.
+    :param source: a file name, file like object or image
+    :param size: the (width, height) to decode to
+    :param quality: one of QUALITY_FAST or QUALITY_EXACT
+    :return: the decoded image, RGB unless source was an RGBA frame
+    """
+    if isinstance(source, Image.Image):
+        if source.size == size and source.mode in ('RGB', 'RGBA'):
+            return source
+        image = source.convert(mode='RGB')
+    else:
+        image = Image.open(source)
+        image.draft('RGB', size)
+        image = image.convert(mode='RGB')
+    if image.size != size:
+        image = image.resize(size, resample=RESAMPLE_FILTERS[quality])
+    return image
+
+
+def create_color_transform(icc_profile):
+    """
+    Builds the transform that converts strips from sRGB to a printer's colors.
+    Building a transform takes far longer than applying it, so it's built
+    once and used for every strip.
+    :param icc_profile: the printer's ICC profile file
+    :return: the transform
+    """
+    from PIL import ImageCms
+    return ImageCms.buildTransform(ImageCms.createProfile('sRGB'), ImageCms.getOpenProfile(icc_profile),
+                                   'RGB', 'RGB', renderingIntent=ImageCms.INTENT_PERCEPTUAL)
+
+
+def is_file_name(strip):
+    """
+    Indicates whether a strip or photo is a file name rather than a buffer.
+    :param strip: the strip or photo
+    :return: True if it's a file name
+    """
+    return not hasattr(strip, 'read')
+
+
+def write_strip(strip, work_dir=None):
+    """
+    Makes sure that a strip is on disk, writing it to a temporary file if it
+    is held in a buffer.
+    :param strip: the strip's file name or buffer
+    :param work_dir: the directory to write the file to
+    :return: the file name
+    """
+    if is_file_name(strip):
+        return strip
+    (handle, file_name) = mkstemp(suffix='.jpg', prefix='photoberry-strip', dir=work_dir)
+    os.write(handle, strip.getvalue())
+    os.close(handle)
+    return file_name
+
+
+def read_strip(strip):
+    """
+    Reads the contents of a strip, removing its file if it was on disk.
+    :param strip: the strip's file name or buffer
+    :return: the JPEG data
+    """
+    if not is_file_name(strip):
+        return strip.getvalue()
+    f = open(strip, 'rb')
+    data = f.read()
+    f.close()
+    os.remove(strip)
+    return data
+
+
+class StripLayout(object):
+    """
+    The geometry of a photo strip: identical columns of `picture_count`
+    photos each, side by side, two of them unless a print profile says
+    otherwise.
+    """
+
+    def __init__(self, photo_resolution, resolution_ratio, picture_count, padding=40,
+                 column_size=None, columns=2, margin=0, size=None, dpi=None):
+        """
+        :param photo_resolution: the resolution of the captured photos
+        :param resolution_ratio: the size of the photos in the strip relative to photo_resolution
+        :param picture_count: the number of photos in a column
+        :param padding: the space around the photos, in pixels
+        :param column_size: the size of a column, defaults to just fitting the
+            photos, the photos are centered in it
+        :param columns: the number of columns
+        :param margin: the space around the columns, in pixels
+        :param size: the size of the strip, defaults to just fitting the columns
+        :param dpi: the resolution that the strip is printed at, if it's known
+        """
+        self.resolution_ratio = resolution_ratio
+        self.picture_count = picture_count
+        self.padding = padding
+        self.columns = columns
+        self.margin = margin
+        self.dpi = dpi
+        self.photo_size = (
+            int(photo_resolution[0] * resolution_ratio),
+            int(photo_resolution[1] * resolution_ratio)
+        )
+        self.column_size = column_size or (
+            self.photo_size[0] + (padding * 2),
+            (self.photo_size[1] * picture_count) + (padding * (picture_count + 1))
+        )
+        self.size = size or (
+            (self.column_size[0] * columns) + (margin * 2),
+            self.column_size[1] + (margin * 2)
+        )
+        photos_height = (self.photo_size[1] * picture_count) + (padding * (picture_count - 1))
+        self._origin = (
+            (self.column_size[0] - self.photo_size[0]) // 2,
+            (self.column_size[1] - photos_height) // 2
+        )
+
+    def photo_box(self, index):
+        """
+        Returns the location within a column that the photo at the given index
+        is pasted to.
+        :param index: the index of the photo
+        :return: the (x, y) location
+        """
+        return self._origin[0], self._origin[1] + (self.padding * index) + (self.photo_size[1] * index)
+
+
+class PrintProfile(object):
+    """
+    The page that a printer prints strips on: its size and resolution, the
+    margins that it can't print, and how many strips are cut from it.
+    Strips rendered for a profile are exactly the printer's raster, so that
+    the print system doesn't have to scale them.
+    """
+
+    def __init__(self, page_size, dpi, margin=0.0, columns=2, padding=0.1, media=None):
+        """
+        :param page_size: the (width, height) of the page, in inches
+        :param dpi: the printer's resolution
+        :param margin: the space around the strips, in inches
+        :param columns: the number of strips cut from the page
+        :param padding: the space around the photos, in inches
+        :param media: the name of the page size for the print system
+        """
+        self.page_size = page_size
+        self.dpi = dpi
+        self.margin = margin
+        self.columns = columns
+        self.padding = padding
+        self.media = media
+
+    @property
+    def size(self):
+        """
+        The (width, height) of the page, in pixels
+        """
+        return int(round(self.page_size[0] * self.dpi)), int(round(self.page_size[1] * self.dpi))
+
+    def layout(self, photo_resolution, picture_count):
+        """
+        Lays a strip out on the page, with the photos as large as they fit in a column
+        :param photo_resolution: the resolution of the captured photos
+        :param picture_count: the number of photos in a column
+        :return: the layout
+        """
+        size = self.size
+        margin = int(round(self.margin * self.dpi))
+        padding = int(round(self.padding * self.dpi))
+        column_size = ((size[0] - (margin * 2)) // self.columns, size[1] - (margin * 2))
+        resolution_ratio = min(
+            float(column_size[0] - (padding * 2)) / photo_resolution[0],
+            float(column_size[1] - (padding * (picture_count + 1))) / (photo_resolution[1] * picture_count))
+        return StripLayout(photo_resolution, resolution_ratio, picture_count, padding=padding,
+                           column_size=column_size, columns=self.columns, margin=margin, size=size, dpi=self.dpi)
+
+    def print_command(self):
+        """
+        Returns an lp command that prints strips at their size, without scaling them
+        :return: the command
+        """
+        command = 'lp '
+        if self.media:
+            command += '-o media=' + self.media + ' '
+        return command + '-o ppi=' + str(self.dpi) + ' -o print-scaling=none {filename}'
+
+
+PRINT_PROFILES = {
+    # two 2x6 strips cut from a 4x6 photo, as dye sub photo booth printers do
+    '4x6-2x6': PrintProfile((4, 6), 300, columns=2, media='Custom.4x6in'),
+    # a single 2x6 strip, for printers that take 2x6 media
+    '2x6': PrintProfile((2, 6), 300, columns=1, media='Custom.2x6in')
+}
+
+
+class StripCompositor(object):
+    """
+    Builds a strip in a worker thread as photos are added to it, so that the
+    strip is ready (or nearly so) by the time the last photo is taken.  Each
+    photo is decoded once, at the size of the largest requested output, and
+    the photos of every smaller output are downscaled from the next larger
+    one's, laid out with the usual padding.
+
+    The columns of a strip are all the same, so only one column is composited
+    and filtered, and it is copied into every column of each output.
+    """
+
+    def __init__(self, photo_resolution, picture_count, outputs, quality=QUALITY_EXACT,
+                 in_memory=False, work_dir=None, layout=None, transforms=None):
+        """
+        :param photo_resolution: the resolution of the captured photos
+        :param picture_count: the number of photos in the strip
+        :param outputs: a dict of output name to resolution ratio
+        :param quality: one of QUALITY_FAST or QUALITY_EXACT
+        :param in_memory: write outputs to in memory buffers rather than files
+        :param work_dir: the directory to write output files to
+        :param layout: the layout of the largest output, such as one from a
+            :class:`PrintProfile`, its resolution ratio has to be the largest
+            of the outputs'
+        :param transforms: a dict of output name to the ImageCms transform that
+            converts it to its printer's colors, see :func:`create_color_transform`
+        """
+        self.outputs = dict(outputs)
+        self.photo_resolution = photo_resolution
+        self.layout = layout or StripLayout(photo_resolution, max(self.outputs.values()), picture_count)
+        self.quality = quality
+        self.in_memory = in_memory
+        self.work_dir = work_dir
+        self.transforms = transforms or dict()
+        self._queue = Queue()
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+        self._cancelled = False
+        self._added = 0
+        self._steps = 0
+        self.timings = {'composite': 0.0, 'color': 0.0, 'encode': 0.0}
+        self._files = dict()
+        self._released = set()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name='photoberry-compositor')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add_photo(self, source):
+        """
+        Queues a photo to be composited into the strip.
+        :param source: a file name, file like object or image
+        """
+        if self._added >= self.layout.picture_count:
+            raise RuntimeError("The strip already has " + str(self._added) + " photos")
+        self._added += 1
+        self._queue.put(source)
+
+    def release(self, name):
+        """
+        Hands ownership of an output's file to the caller, it will still be
+        written, if all of the photos were added, and not be removed when the
+        compositor is cancelled.
+        :param name: the name of the output
+        """
+        with self._lock:
+            self._released.add(name)
+
+    def cancel(self):
+        """
+        Drops the strip without waiting for the worker, which stops at its
+        next step unless a released output is still to be written, those are
+        finished first.  The files of any outputs that were written but not
+        released are removed, by the worker if it's still running.
+        """
+        with self._lock:
+            self._cancelled = True
+            if self._finished.is_set():
+                self._remove_unreleased()
+        self._queue.put(None)
+
+    def result(self, timeout=None):
+        """
+        Waits for the strip to be finished.
+        :param timeout: the number of seconds to wait, or None to wait forever
+        :return: a dict of output name to file name (or buffer when in_memory is set),
+            or None if it isn't finished yet
+        """
+        if not self._finished.wait(timeout):
+            return None
+        if self._error:
+            raise self._error
+        with self._lock:
+            return dict(self._files)
+
+    @property
+    def progress(self):
+        """
+        The fraction of the strip's work that has been completed, from 0.0 to 1.0
+        """
+        return float(self._steps) / (self.layout.picture_count + 1 + len(self.outputs))
+
+    @property
+    def done(self):
+        """
+        Indicates whether or not the strip has been finished (or has failed).
+        """
+        return self._finished.is_set()
+
+    @property
+    def error(self):
+        """
+        The exception that the strip failed with, or None
+        """
+        return self._error
+
+    def _run(self):
+        column = None
+        try:
+            column = Image.new('RGB', self.layout.column_size, ImageColor.getcolor('#ffffff', 'RGB'))
+
+            for i in range(0, self.layout.picture_count):
+                source = self._queue.get()
+                if source is None or self._stopping():
+                    debug("strip cancelled after %s photos", i)
+                    return
+                start = time()
+                image = load_photo(source, self.layout.photo_size, quality=self.quality)
+                decoded = time()
+                column.paste(image, box=self.layout.photo_box(i))
+                del image
+                end = time()
+                self.timings['composite'] += end - start
+                instrumentation.record(instrumentation.DECODE, decoded - start)
+                instrumentation.record(instrumentation.COMPOSITE, end - decoded)
+                self._steps += 1
+
+            start = time()
+            column = column.transpose(Image.FLIP_LEFT_RIGHT)
+            column = column.filter(DETAIL_SHARPEN)
+            elapsed = time() - start
+            self.timings['composite'] += elapsed
+            instrumentation.record(instrumentation.COMPOSITE, elapsed)
+            self._steps += 1
+
+            layout = self.layout
+            for name, ratio in sorted(self.outputs.items(), key=lambda o: o[1], reverse=True):
+                if self._stopping():
+                    return
+                if self._cancelled and name not in self._released:
+                    continue
+                start = time()
+                if ratio != layout.resolution_ratio:
+                    # smaller outputs get a layout of their own, so that their
+                    # padding is the same number of pixels as in any other strip
+                    output_layout = StripLayout(self.photo_resolution, ratio, layout.picture_count)
+                    column = self._scale_column(column, layout, output_layout)
+                    layout = output_layout
+                elapsed = time() - start
+
+                # the columns are all the same, so converting one of them and
+                # the color of the page is as good as converting the strip
+                output_column = column
+                background = ImageColor.getcolor('#ffffff', 'RGB')
+                transform = self.transforms.get(name)
+                if transform:
+                    color_start = time()
+                    output_column = transform.apply(column)
+                    background = transform.apply(Image.new('RGB', (1, 1), background)).getpixel((0, 0))
+                    color_elapsed = time() - color_start
+                    self.timings['color'] += color_elapsed
+                    instrumentation.record(instrumentation.COLOR, color_elapsed)
+
+                start = time()
+                strip = Image.new('RGB', layout.size, background)
+                for i in range(0, layout.columns):
+                    strip.paste(output_column, box=(layout.margin + (layout.column_size[0] * i), layout.margin))
+                del output_column
+                elapsed += time() - start
+                self.timings['composite'] += elapsed
+                instrumentation.record(instrumentation.COMPOSITE, elapsed)
+                start = time()
+                self._save(name, strip, layout.dpi)
+                elapsed = time() - start
+                self.timings['encode'] += elapsed
+                instrumentation.record(instrumentation.ENCODE, elapsed)
+                del strip
+                self._steps += 1
+
+        except Exception as e:
+            error("unable to create strip: %s", e)
+            self._error = e
+
+        finally:
+            del column
+            with self._lock:
+                if self._cancelled:
+                    self._remove_unreleased()
+                self._finished.set()
+
+    def _scale_column(self, column, layout, output_layout):
+        """
+        Downscales the photos of a finished column into a column of a smaller layout.
+        :param column: the finished column, which is flipped
+        :param layout: the column's layout
+        :param output_layout: the layout to downscale to
+        :return: the new column
+        """
+        output = Image.new('RGB', output_layout.column_size, ImageColor.getcolor('#ffffff', 'RGB'))
+        for i in range(0, layout.picture_count):
+            # the columns are flipped, so their photos are mirrored in them
+            (x, y) = layout.photo_box(i)
+            x = layout.column_size[0] - x - layout.photo_size[0]
+            photo = column.crop((x, y, x + layout.photo_size[0], y + layout.photo_size[1]))
+            photo = photo.resize(output_layout.photo_size, resample=RESAMPLE_FILTERS[self.quality])
+            (x, y) = output_layout.photo_box(i)
+            output.paste(photo, box=(output_layout.column_size[0] - x - output_layout.photo_size[0], y))
+        return output
+
+    def _stopping(self):
+        # a cancelled strip is still finished for the outputs that were released
+        with self._lock:
+            return self._cancelled and not self._released.difference(self._files)
+
+    def _remove_unreleased(self):
+        for name, file_name in self._files.items():
+            if name in self._released or not is_file_name(file_name):
+                continue
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        self._files = dict((name, f) for name, f in self._files.items() if name in self._released)
+
+    def _save(self, name, strip, dpi=None):
+        options = {'quality': 95, 'optimize': True}
+        if dpi:
+            options['dpi'] = (int(round(dpi)), int(round(dpi)))
+        if self.in_memory:
+            stream = BytesIO()
+            strip.save(stream, format='jpeg', **options)
+            stream.seek(0)
+            with self._lock:
+                self._files[name] = stream
+            return
+
+        (handle, file_name) = mkstemp(suffix='.jpg', prefix='photoberry-strip', dir=self.work_dir)
+        os.close(handle)
+        handle = open(file_name, 'wb')
+        strip.save(handle, format='jpeg', **options)
+        handle.close()
+        with self._lock:
+            self._files[name] = file_name
@@ -9,7 +9,7 @@ class Timer(object):
         self._start = 0
 
     def start(self, duration=None):
-        if duration:
+        if duration is not None:
             self._duration = duration
         self._start = time()
 
@@ -20,6 +20,10 @@ class Timer(object):
     def remaining(self):
         return self._duration - (time() - self._start)
 
+    @property
+    def deadline(self):
+        return self._start + self._duration
+
     @property
     def finished(self):
         return self.remaining <= 0
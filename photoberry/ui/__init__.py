@@ -1,36 +1,149 @@
 import ctypes
-from time import sleep, time
+from time import time
 from logging import debug
-from picamera import bcm_host, mmal
+from PIL import Image
+import threading
 
-from .widget import Widget
+try:
+    from picamera import bcm_host
+except ImportError:
+    bcm_host = None
+
+from .. import instrumentation
+from ..timer import Timer
+from .widget import Widget, intersect_rect, union_rect
 from .widget_label import LabelWidget
 from .constants import *
+from . import fonts
+from .sprites import SpriteCache, sprite_cache
 
 
 class UIContext(object):
     """
-    Does the main loop for the UI
+    Does the main loop for the UI.  Between ticks the loop sleeps until the
+    next deadline reported by deadline_function, until a pending render is
+    due, or until :meth:`wake` is called, whichever comes first.
     """
 
-    def __init__(self, canvas, root, update_function=lambda x: 0):
+    def __init__(self, canvas, root, update_function=lambda x: 0, render_function=None, render_interval=0.1,
+                 deadline_function=None, max_sleep=1.0):
+        """
+        :param canvas: the canvas that the widgets draw on
+        :param root: the root widget
+        :param update_function: called on every tick, the loop ends when it returns False
+        :param render_function: called to push the canvas to the screen after it was drawn
+            on, with the (x,y,width,height) region that changed since the last push
+        :param render_interval: the minimum number of seconds between calls to render_function
+        :param deadline_function: called after every tick, returns the time, as returned by
+            :func:`time.time`, that the next tick is needed at or None if there's no deadline
+        :param max_sleep: the maximum number of seconds to sleep between ticks
+        """
         self._canvas = canvas
         self._update_function = update_function
+        self._render_function = render_function
+        self._render_timer = Timer(render_interval)
+        self._render_pending = False
+        self._damage = None
+        self._deadline_function = deadline_function
+        self._max_sleep = max_sleep
+        self._condition = threading.Condition()
+        self._woken = False
         self._root = root
 
+    def wake(self):
+        """
+        Makes the main loop tick right away, for instance because an input
+        changed.  Can be called from any thread.
+        """
+        with self._condition:
+            self._woken = True
+            self._condition.notify()
+
+    def _wait(self):
+        """
+        Sleeps until the next tick is needed.
+        """
+        deadline = time() + self._max_sleep
+        if self._deadline_function:
+            next_deadline = self._deadline_function()
+            if next_deadline is not None:
+                deadline = min(deadline, next_deadline)
+        if self._render_pending:
+            deadline = min(deadline, self._render_timer.deadline)
+
+        with self._condition:
+            if not self._woken:
+                timeout = deadline - time()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+            self._woken = False
+
+    def _redraw(self):
+        """
+        Lays out the invalidated widgets and redraws only the region of the
+        screen that they cover.
+        :return: the (x,y,width,height) region that was redrawn, or None
+        """
+        start = time()
+        dirty = list()
+        self._root.find_dirty(dirty)
+        self._root.layout(self._canvas)
+        instrumentation.record(instrumentation.LAYOUT, time() - start)
+
+        region = None
+        for widget in dirty:
+            region = union_rect(region, widget.damage)
+        if not region:
+            return None
+        region = intersect_rect(region, self._root.screen_dimensions)
+        if not region:
+            return None
+
+        # expanding the region can make it overlap more widgets
+        while True:
+            expanded = self._root.expand_damage(region)
+            if expanded == region:
+                break
+            region = expanded
+
+        start = time()
+        self._root.draw(self._canvas, clip=region)
+        instrumentation.record(instrumentation.DRAW, time() - start)
+        return region
+
     def main_loop(self):
-        while self._update_function():
+        while True:
+            start = time()
+            if not self._update_function():
+                break
+
             if self._root.dirty:
+                region = self._redraw()
+                if region:
+                    self._damage = union_rect(self._damage, region)
+                    self._render_pending = True
+
+            # push as soon as something was drawn, unless the last push was
+            # less than render_interval ago, and not at all while idle
+            if self._render_pending and self._render_function and self._render_timer.finished:
+                with instrumentation.timed(instrumentation.RENDER):
+                    self._render_function(self._damage)
+                self._render_pending = False
+                self._damage = None
+                self._render_timer.start()
 
-                # start = time()
-                self._root.layout(self._canvas)
-                # debug("layout time: %s", time() - start)
+            instrumentation.record(instrumentation.TICK, time() - start)
+            self._wait()
 
-                # start = time()
-                self._root.draw(self._canvas)
-                # debug("draw time: %s", time() - start)
 
-            sleep(0.06)
+def align_up(value, alignment):
+    """
+    Rounds a value up to the nearest multiple of alignment.
+    :param value: the value
+    :param alignment: the alignment
+    :return: the aligned value
+    """
+    return ((int(value) + alignment - 1) // alignment) * alignment
 
 
 def normalize_dimension(dimension):
@@ -44,24 +157,41 @@ def normalize_dimension(dimension):
         return (
             int(dimension[0]),
             int(dimension[1]),
-            mmal.VCOS_ALIGN_UP(int(dimension[2]), 32),
-            mmal.VCOS_ALIGN_UP(int(dimension[3]), 16)
+            align_up(dimension[2], 32),
+            align_up(dimension[3], 16)
         )
     else:
         return (
-            mmal.VCOS_ALIGN_UP(int(dimension[0]), 32),
-            mmal.VCOS_ALIGN_UP(int(dimension[1]), 16)
+            align_up(dimension[0], 32),
+            align_up(dimension[1], 16)
         )
 
 
+def create_buffer_image(size):
+    """
+    Creates an RGBA image whose pixels live in a preallocated bytearray, so
+    that the bytearray can be handed to an overlay renderer as it is instead
+    of converting the image to bytes every time it changes.
+    :param size: the (width, height) of the image
+    :return: a tuple of (image, bytearray)
+    """
+    data = bytearray(size[0] * size[1] * 4)
+    image = Image.frombuffer('RGBA', size, data, 'raw', 'RGBA', 0, 1)
+    # images mapped onto a buffer are marked read only, which would make
+    # ImageDraw copy the image before drawing rather than draw into the buffer
+    image.readonly = 0
+    return image, data
+
+
 def get_screen_resolution():
     """
-    Returns the screen's resolution in (width, height)
+    Returns the screen's resolution in (width, height), or 1280x720 if it
+    can't be determined
     :return: the resultion
     """
     w = ctypes.c_uint32()
     h = ctypes.c_uint32()
-    if bcm_host.graphics_get_display_size(0, w, h) == -1:
+    if not bcm_host or bcm_host.graphics_get_display_size(0, w, h) == -1:
         w = 1280
         h = 720
     else:
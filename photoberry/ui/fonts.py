@@ -0,0 +1,71 @@
+
+from PIL import ImageFont
+
+MAX_FONTS   = 256
+MAX_FITS    = 1024
+
+_fonts = dict()
+_fits = dict()
+
+stats = {
+    'font_hits': 0,
+    'font_misses': 0,
+    'fit_hits': 0,
+    'fit_misses': 0
+}
+
+
+def get_font(font_name, size):
+    """
+    Returns a font, loading it only the first time it is asked for.
+    :param font_name: the font file
+    :param size: the size
+    :return: the font
+    """
+    key = (font_name, size)
+    font = _fonts.get(key)
+    if font is not None:
+        stats['font_hits'] += 1
+        return font
+    stats['font_misses'] += 1
+    if len(_fonts) >= MAX_FONTS:
+        _fonts.clear()
+    font = ImageFont.truetype(font_name, size)
+    _fonts[key] = font
+    return font
+
+
+def fit_text(canvas, text, font_name, box_size):
+    """
+    Finds the largest font size at which text fits in a box.  The result is
+    remembered, so fitting the same text to the same box again is free.
+    :param canvas: the canvas that the text will be drawn on
+    :param text: the text
+    :param font_name: the font file
+    :param box_size: the (width, height) of the box
+    :return: a tuple of (font size, (width, height) of the text at that size)
+    """
+    key = (text, font_name, box_size)
+    fit = _fits.get(key)
+    if fit is not None:
+        stats['fit_hits'] += 1
+        return fit
+    stats['fit_misses'] += 1
+
+    min = 1
+    max = 1024
+    while min != max:
+        current = min + (max - min) // 2
+        if current == min or current == max:
+            break
+        text_size = canvas.textsize(text, font=get_font(font_name, current))
+        if text_size[0] > box_size[0] or text_size[1] > box_size[1]:
+            max = current
+        else:
+            min = current
+
+    fit = (min, canvas.textsize(text, font=get_font(font_name, min)))
+    if len(_fits) >= MAX_FITS:
+        _fits.clear()
+    _fits[key] = fit
+    return fit
@@ -0,0 +1,62 @@
+
+from collections import OrderedDict
+from PIL import Image, ImageDraw
+
+from .fonts import get_font
+
+
+class SpriteCache(object):
+    """
+    A least recently used cache of text rasterized into masks, so that drawing
+    text that was drawn before is a blit rather than a FreeType render.  The
+    masks don't depend on the color that they're drawn in.
+    """
+
+    def __init__(self, max_size=64):
+        """
+        :param max_size: the maximum number of sprites to keep
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._sprites = OrderedDict()
+
+    def get(self, text, font_name, font_size, align="left"):
+        """
+        Returns the sprite for a text, rasterizing it if it isn't cached.
+        :param text: the text
+        :param font_name: the font file
+        :param font_size: the font size
+        :param align: the alignment of multiline text
+        :return: a tuple of ('L' mode mask, (x, y) offset of the text within the mask)
+        """
+        key = (text, font_name, font_size, align)
+        sprite = self._sprites.pop(key, None)
+        if sprite is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            sprite = self._rasterize(text, get_font(font_name, font_size), font_size, align)
+            while len(self._sprites) >= self.max_size:
+                self._sprites.popitem(last=False)
+        self._sprites[key] = sprite
+        return sprite
+
+    def clear(self):
+        """
+        Removes all sprites
+        """
+        self._sprites.clear()
+
+    def _rasterize(self, text, font, font_size, align):
+        # glyphs can reach a little outside of the size that textsize
+        # reports, so leave a margin around the text
+        margin = font_size // 4 + 1
+        canvas = ImageDraw.Draw(Image.new('L', (1, 1)))
+        text_size = canvas.textsize(text, font=font)
+        mask = Image.new('L', (text_size[0] + (margin * 2), text_size[1] + (margin * 2)))
+        ImageDraw.Draw(mask).text((margin, margin), text, font=font, fill=255, align=align)
+        return mask, (margin, margin)
+
+
+sprite_cache = SpriteCache()
@@ -1,4 +1,40 @@
 
+def union_rect(a, b):
+    """
+    Returns the smallest rectangle that contains two rectangles.
+    :param a: an (x,y,width,height) rectangle, or None
+    :param b: an (x,y,width,height) rectangle, or None
+    :return: the rectangle
+    """
+    if not a:
+        return b
+    if not b:
+        return a
+    x = min(a[0], b[0])
+    y = min(a[1], b[1])
+    return (
+        x, y,
+        max(a[0] + a[2], b[0] + b[2]) - x,
+        max(a[1] + a[3], b[1] + b[3]) - y
+    )
+
+
+def intersect_rect(a, b):
+    """
+    Returns the overlap of two rectangles.
+    :param a: an (x,y,width,height) rectangle
+    :param b: an (x,y,width,height) rectangle
+    :return: the rectangle, or None if they don't overlap
+    """
+    x = max(a[0], b[0])
+    y = max(a[1], b[1])
+    width = min(a[0] + a[2], b[0] + b[2]) - x
+    height = min(a[1] + a[3], b[1] + b[3]) - y
+    if width <= 0 or height <= 0:
+        return None
+    return x, y, width, height
+
+
 class Widget(object):
     """
     A renderable widget
@@ -10,6 +46,11 @@ class Widget(object):
         self._dimensions = (0, 0, 0, 0)
         self._visible = True
         self._dirty = True
+        self._dirty_children = False
+        self._screen_location = None
+        self._drawn_dimensions = None
+        self._name = None
+        self._names = dict()
         self.name = name
         self.children = list()
         self.background_color = None
@@ -34,61 +75,147 @@ class Widget(object):
 
     def layout(self, canvas):
         """
-        Called when the widget needs to lay itself out
+        Called when the widget needs to lay itself out, only the widget and
+        those of its descendants that were invalidated are laid out
         """
         if not self.visible:
+            self._dirty = False
+            self._dirty_children = False
             return
-        self.do_layout(canvas)
-        self._dirty = False
+        if self._dirty:
+            self.do_layout(canvas)
+            self._dirty = False
+        if self._dirty_children:
+            self._dirty_children = False
+            for child in self.children:
+                if child.dirty:
+                    child.layout(canvas)
+
+    def find_dirty(self, found):
+        """
+        Collects the invalidated widgets in this widget's tree, following only
+        the branches that contain one.
+        :param found: the list to add the widgets to
+        """
+        if self._dirty:
+            found.append(self)
+        if self._dirty_children:
+            for child in self.children:
+                child.find_dirty(found)
+
+    @property
+    def damage(self):
+        """
+        The screen rectangle that needs to be redrawn for this widget once it
+        has been laid out: where it was last drawn plus where it is now.
+        """
+        damage = self._drawn_dimensions
+        if self.visible:
+            damage = union_rect(damage, self.screen_dimensions)
+        return damage
+
+    def expand_damage(self, region):
+        """
+        Grows a damaged region so that it fully covers every visible widget
+        in this widget's tree that draws content and overlaps it.  Content
+        drawn by do_draw isn't clipped, so such widgets must be redrawn whole.
+        :param region: the (x,y,width,height) region
+        :return: the expanded region
+        """
+        if not self.visible:
+            return region
+        dimensions = self.screen_dimensions
+        if type(self).do_draw != Widget.do_draw and intersect_rect(dimensions, region):
+            region = union_rect(region, dimensions)
         for child in self.children:
-            child.layout(canvas)
+            region = child.expand_damage(region)
+        return region
 
     def find_by_name(self, name):
         """
-        Finds a widget by name.
+        Finds a widget by name in this widget's tree, using the root widget's
+        index of names.
         :param name: the name
         :return: the widget, or None if not found
         """
-        if self.name == name:
-            return self
-        for child in self.children:
-            if child.name == name:
-                return child
-        for child in self.children:
-            ret = child.find_by_name(name)
-            if ret:
-                return ret
+        widget = self.root._names.get(name)
+        ancestor = widget
+        while ancestor:
+            if ancestor is self:
+                return widget
+            ancestor = ancestor._parent
         return None
 
-    def draw(self, canvas):
+    def _collect_names(self, names):
+        """
+        Adds the names in this widget's tree to a dict of name to widget.
+        :param names: the dict
+        """
+        if self._name is not None:
+            names[self._name] = self
+        for child in self.children:
+            child._collect_names(names)
+
+    def draw(self, canvas, clip=None):
         """
         An :class:`~ImageDraw` class is passed as a canvas for the widget to draw itself.
         :param canvas: the canvas
+        :param clip: if given, only widgets overlapping this (x,y,width,height)
+            rectangle are drawn and backgrounds are only filled within it
         """
         if not self.visible:
             return
+        dimensions = self.screen_dimensions
+        area = dimensions
+        if clip:
+            area = intersect_rect(dimensions, clip)
+            if not area:
+                return
         if self.background_color:
             canvas.rectangle((
-                self.screen_dimensions[0],
-                self.screen_dimensions[1],
-                self.screen_dimensions[0] + self.screen_dimensions[2],
-                self.screen_dimensions[1] + self.screen_dimensions[3]
+                area[0],
+                area[1],
+                area[0] + area[2] - 1,
+                area[1] + area[3] - 1
             ), fill=self.background_color)
         self.do_draw(canvas)
+        self._drawn_dimensions = dimensions
         for child in self.children:
-            child.draw(canvas)
+            child.draw(canvas, clip)
 
     def invalidate(self):
         """
         Marks this widget as invalid which causes it to be re layed out and drawn.
+        Its ancestors are marked as having an invalid descendant, so checking
+        whether a tree is dirty doesn't have to walk it.
         """
         self._dirty = True
+        parent = self._parent
+        while parent and not parent._dirty_children:
+            parent._dirty_children = True
+            parent = parent._parent
+
+    def _invalidate_screen_location(self):
+        """
+        Drops the cached screen location of this widget and its descendants,
+        called when the widget moves.
+        """
+        self._screen_location = None
+        for child in self.children:
+            child._invalidate_screen_location()
 
     def add_child(self, child):
         """
-        Adds a child widget
+        Adds a child widget.  Raises ValueError if a widget in the child's tree
+        has the same name as one in this widget's tree.
         :param child: the child to add
         """
+        names = self.root._names
+        for name in child._names:
+            if name in names:
+                raise ValueError("A widget named " + str(name) + " already exists")
+        names.update(child._names)
+        child._names = dict()
         self.children.append(child)
         child.parent = self
         self.invalidate()
@@ -99,6 +226,10 @@ class Widget(object):
         :param child: the child to remove
         """
         self.children.remove(child)
+        names = self.root._names
+        child._collect_names(child._names)
+        for name in child._names:
+            del names[name]
         child.parent = None
         self.invalidate()
 
@@ -109,12 +240,7 @@ class Widget(object):
         to be a dirty, dirty... dirty little girl.
         :return: True if invalid
         """
-        if self._dirty:
-            return True
-        for child in self.children:
-            if child.dirty:
-                return True
-        return False
+        return self._dirty or self._dirty_children
 
     @property
     def root(self):
@@ -122,7 +248,7 @@ class Widget(object):
         Returns the root widget in this widget's hierarchy.
         :return: the root widget
         """
-        return self.root if self.parent else self
+        return self.parent.root if self.parent else self
 
     @property
     def visible(self):
@@ -152,10 +278,20 @@ class Widget(object):
     @name.setter
     def name(self, name):
         """
-        Sets the widget's name
-        :param parent: the name
+        Sets the widget's name.  Raises ValueError if another widget in the
+        tree already has the name.
+        :param name: the name
         """
+        if name == self._name:
+            return
+        names = self.root._names
+        if name is not None and name in names:
+            raise ValueError("A widget named " + str(name) + " already exists")
+        if self._name is not None:
+            del names[self._name]
         self._name = name
+        if name is not None:
+            names[name] = self
 
     @property
     def parent(self):
@@ -173,6 +309,7 @@ class Widget(object):
         if self._parent == parent:
             return
         self._parent = parent
+        self._invalidate_screen_location()
         self.invalidate()
 
     @property
@@ -191,6 +328,8 @@ class Widget(object):
         dimensions = (int(dimensions[0]), int(dimensions[1]), int(dimensions[2]), int(dimensions[3]))
         if self._dimensions == dimensions:
             return
+        if self._dimensions[0:2] != dimensions[0:2]:
+            self._invalidate_screen_location()
         self._dimensions = dimensions
         self.invalidate()
 
@@ -199,15 +338,7 @@ class Widget(object):
         """
         The coordinates of the widget relative to the root widget in (x,y,width,height)
         """
-        if not self.parent:
-            return self.dimensions
-
-        return (
-            self.dimensions[0] + self.parent.screen_x,
-            self.dimensions[1] + self.parent.screen_y,
-            self.dimensions[2],
-            self.dimensions[3]
-        )
+        return self.screen_location + self.size
 
     @screen_dimensions.setter
     def screen_dimensions(self, dimensions):
@@ -250,15 +381,19 @@ class Widget(object):
     @property
     def screen_location(self):
         """
-        The location of the widget relative to the root widget in (x,y)
+        The location of the widget relative to the root widget in (x,y), this is
+        cached until the widget or one of its ancestors moves
         """
-        if not self.parent:
-            return self.location
-
-        return (
-            self.location[0] + self.parent.screen_location[0],
-            self.location[1] + self.parent.screen_location[1]
-        )
+        if self._screen_location is None:
+            if not self.parent:
+                self._screen_location = self.location
+            else:
+                parent_location = self.parent.screen_location
+                self._screen_location = (
+                    self.location[0] + parent_location[0],
+                    self.location[1] + parent_location[1]
+                )
+        return self._screen_location
 
     @location.setter
     def location(self, location):
@@ -281,9 +416,7 @@ class Widget(object):
         """
         The `x` coordinate of the widget relative to the root widget
         """
-        if not self.parent:
-            return self.x
-        return self.x + self.parent.screen_x
+        return self.screen_location[0]
 
     @x.setter
     def x(self, x):
@@ -310,9 +443,7 @@ class Widget(object):
         """
         The `y` coordinate of the widget relative to the root widget
         """
-        if not self.parent:
-            return self.y
-        return self.y + self.parent.screen_y
+        return self.screen_location[1]
 
     @y.setter
     def y(self, y):
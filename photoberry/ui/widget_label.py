@@ -1,9 +1,10 @@
 
 from logging import debug
-from PIL import ImageFont
 
 from .widget import Widget
 from .constants import default_font
+from .fonts import fit_text, get_font
+from .sprites import sprite_cache
 
 
 class LabelWidget(Widget):
@@ -28,29 +29,26 @@ class LabelWidget(Widget):
         self._box_size = None
 
     def do_layout(self, canvas):
-        min = 1
-        max = 1024
-        current = -1
-        while min != max:
-            current = min + (max - min) / 2
-            if current == min or current == max:
-                break
-            font = ImageFont.truetype(self.font_name, current)
-            box_size = canvas.textsize(self.text, font=font)
-            if box_size[0] > self.width or box_size[1] > self.height:
-                max = current
-            else:
-                min = current
-
-        self._font_size = current
-        self._font = ImageFont.truetype(self.font_name, self._font_size)
-        self._box_size = canvas.textsize(self.text, font=self._font)
+        (self._font_size, self._box_size) = fit_text(canvas, self.text, self.font_name, self.size)
+        self._font = get_font(self.font_name, self._font_size)
 
     def do_draw(self, canvas):
-        canvas.text((
-                self.screen_x + ((self.width / 2) - (self._box_size[0] / 2)),
-                self.screen_y + ((self.height / 2) - (self._box_size[1] / 2))
-            ), self.text, font=self._font, fill=self._font_color, align=self._align)
+        (mask, offset) = sprite_cache.get(self.text, self.font_name, self._font_size, self._align)
+        canvas.bitmap((
+                self.screen_x + ((self.width // 2) - (self._box_size[0] // 2)) - offset[0],
+                self.screen_y + ((self.height // 2) - (self._box_size[1] // 2)) - offset[1]
+            ), mask, fill=self._font_color)
+
+    def prerender(self, canvas, texts):
+        """
+        Lays out and rasterizes texts that this label will display, so that
+        displaying them later is only a blit.
+        :param canvas: the canvas
+        :param texts: the texts
+        """
+        for text in texts:
+            (font_size, box_size) = fit_text(canvas, text, self.font_name, self.size)
+            sprite_cache.get(text, self.font_name, font_size, self._align)
 
     @property
     def text(self):
@@ -6,7 +6,7 @@ from setuptools import find_packages, setup
 dependencies = [
         'click==6.6',
         'Pillow==3.2.0',
-        'picamera==1.10',
+        'picamera==1.13',
         'RPi.GPIO==0.6.2',
         'TwitterAPI==2.4.1'
     ]
@@ -28,6 +28,7 @@ setup(
     entry_points={
         'console_scripts': [
             'photoberry = photoberry.cli:main',
+            'photoberry-benchmark = photoberry.benchmark:main',
         ],
     },
     classifiers=[